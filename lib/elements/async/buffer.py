@@ -0,0 +1,311 @@
+# This file is part of Elements.
+# Copyright (c) 2010 Sean Kerr. All rights reserved.
+#
+# The full license is available in the LICENSE file that was distributed with this source code.
+#
+# Author: Sean Kerr <sean@code-box.org>
+
+import errno
+import mmap
+import os
+import socket
+import struct
+
+try:
+    from sendfile import sendfile
+except ImportError:
+    sendfile = getattr(os, "sendfile", None)
+
+from elements.core.exception import ChannelException
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+RING_COUNTER = struct.Struct("Q")
+RING_LENGTH  = struct.Struct("I")
+
+RING_HEAD    = 0   # offset of the read counter, which only the reader changes
+RING_TAIL    = 64  # offset of the write counter, which only the writer changes
+RING_WAITING = 128 # offset of the flag that indicates the writer is waiting for room
+RING_DATA    = 192 # offset at which the ring data starts
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class BufferPool:
+
+    def __init__ (self):
+        """
+        Create a new BufferPool instance.
+
+        A buffer pool hands out preallocated scratch buffers that sockets can read into with recv_into(). Each process
+        owns its own pool, and since read data is always moved out of a scratch buffer before any callback is executed,
+        a single buffer per size is all that a process ever needs.
+        """
+
+        self._buffers = {} # scratch buffers indexed by size
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def clear (self):
+        """
+        Release all scratch buffers.
+        """
+
+        self._buffers.clear()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def get (self, size):
+        """
+        Retrieve a scratch buffer.
+
+        @param size (int) The buffer size.
+
+        @return (memoryview) A writable view of the scratch buffer.
+        """
+
+        try:
+            return self._buffers[size]
+
+        except KeyError:
+            buffer = self._buffers[size] = memoryview(bytearray(size))
+
+            return buffer
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class FileRegion:
+
+    def __init__ (self, file, offset, length):
+        """
+        Create a new FileRegion instance.
+
+        A file region is a write buffer segment that is sent with sendfile(), so its contents are copied from the page
+        cache to the socket by the kernel, without ever being read into a Python string.
+
+        @param file   (file) The file, which will be kept open for as long as the region is referenced.
+        @param offset (int)  The offset at which the region starts.
+        @param length (int)  The region length.
+        """
+
+        self._file   = file   # file containing the region
+        self._length = length # region length
+        self._offset = offset # offset at which the region starts
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __len__ (self):
+        """
+        Retrieve the region length.
+
+        @return (int) The region length.
+        """
+
+        return self._length
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def send (self, client_socket):
+        """
+        Send as much of the region as the socket will accept.
+
+        @param client_socket (socket) The socket.
+
+        @return (int) The number of bytes that have been sent.
+        """
+
+        try:
+            length = sendfile(client_socket.fileno(), self._file.fileno(), self._offset, self._length)
+
+        except OSError, e:
+            # sendfile() failures are socket failures as far as the write buffer is concerned
+            raise socket.error(e[0], e[1])
+
+        if not length:
+            # the file has been truncated since the region was created, and nothing else is ever going to be sent
+            raise socket.error(errno.EIO, "File region is beyond the end of the file")
+
+        return length
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def slice (self, index):
+        """
+        Retrieve the remainder of the region.
+
+        @param index (int) The index at which the remainder starts.
+
+        @return (FileRegion) The remainder of the region.
+        """
+
+        return FileRegion(self._file, self._offset + index, self._length - index)
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class RingBuffer:
+
+    def __init__ (self, size):
+        """
+        Create a new RingBuffer instance.
+
+        A ring buffer is a single-producer/single-consumer queue of records in shared memory. It must be created before
+        the process forks, and afterwards exactly one process writes to it and exactly one other process reads from it.
+
+        The read and write counters only ever increase, and each is changed by one side only. Records are written before
+        the write counter is published, so the reader never sees a partial record.
+
+        @param size (int) The size of the ring data in bytes.
+        """
+
+        self._map  = mmap.mmap(-1, RING_DATA + size) # shared memory, which is inherited by forked processes
+        self._size = size                            # size of the ring data
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def close (self):
+        """
+        Release the shared memory.
+        """
+
+        self._map.close()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def get (self):
+        """
+        Remove all records from the ring.
+
+        @return (tuple) A two-part tuple containing the list of records, and a bool that indicates that the writer was
+                        waiting for room and must be woken up.
+        """
+
+        map       = self._map
+        records   = []
+        head      = RING_COUNTER.unpack_from(map, RING_HEAD)[0]
+        is_waking = False
+
+        while True:
+            tail = RING_COUNTER.unpack_from(map, RING_TAIL)[0]
+
+            while head < tail:
+                length = RING_LENGTH.unpack(self.__read(head, 4))[0]
+
+                records.append(self.__read(head + 4, length))
+
+                head += 4 + length
+
+            # publish the room that has been freed
+            RING_COUNTER.pack_into(map, RING_HEAD, head)
+
+            if map[RING_WAITING] != "\0":
+                map[RING_WAITING] = "\0"
+                is_waking         = True
+
+            # the writer may have appended a record while the read counter and the flag were being handled, after it
+            # had already read the old read counter, in which case it won't ring the doorbell for it
+            if RING_COUNTER.unpack_from(map, RING_TAIL)[0] == head:
+                break
+
+        return records, is_waking
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def put (self, record):
+        """
+        Append a record to the ring.
+
+        @param record (str) The record.
+
+        @return (bool) None if there is no room for the record, otherwise True if the reader had emptied the ring and must
+                       be woken up, or False if it's still going to find the record on its own.
+        """
+
+        if 4 + len(record) > self._size:
+            raise ChannelException("Cannot put a %d byte record into a %d byte ring" % (len(record), self._size))
+
+        map  = self._map
+        head = RING_COUNTER.unpack_from(map, RING_HEAD)[0]
+        tail = RING_COUNTER.unpack_from(map, RING_TAIL)[0]
+
+        if self._size - (tail - head) < 4 + len(record):
+            # let the reader know that room is needed, so it wakes us up once it has emptied the ring
+            map[RING_WAITING] = "\1"
+
+            # the reader may have emptied the ring and checked the flag before it was set, in which case it won't wake
+            # us up, so the read counter is checked once more (a leftover flag only causes a spare wake up call)
+            head = RING_COUNTER.unpack_from(map, RING_HEAD)[0]
+
+            if self._size - (tail - head) < 4 + len(record):
+                return None
+
+        self.__write(tail, RING_LENGTH.pack(len(record)))
+        self.__write(tail + 4, record)
+
+        RING_COUNTER.pack_into(map, RING_TAIL, tail + 4 + len(record))
+
+        # the reader only goes back to sleep after it has published a read counter that matches the write counter it
+        # last saw
+        return RING_COUNTER.unpack_from(map, RING_HEAD)[0] == tail
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __read (self, counter, length):
+        """
+        Read data that may wrap around the end of the ring.
+
+        @param counter (int) The counter at which the data starts.
+        @param length  (int) The data length.
+
+        @return (str) The data.
+        """
+
+        start = RING_DATA + counter % self._size
+        end   = start + length
+
+        if end <= RING_DATA + self._size:
+            return self._map[start:end]
+
+        return self._map[start:] + self._map[RING_DATA:end - self._size]
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __write (self, counter, data):
+        """
+        Write data that may wrap around the end of the ring.
+
+        @param counter (int) The counter at which the data starts.
+        @param data    (str) The data.
+        """
+
+        start = RING_DATA + counter % self._size
+        end   = start + len(data)
+
+        if end <= RING_DATA + self._size:
+            self._map[start:end] = data
+
+            return
+
+        split = RING_DATA + self._size - start
+
+        self._map[start:]                     = data[:split]
+        self._map[RING_DATA:end - self._size] = data[split:]
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def file_segment (file, offset, length):
+    """
+    Create a write buffer segment for a region of a file.
+
+    Note: When sendfile() is unavailable, the file is memory-mapped and the region is sent from a read-only view, which
+          still keeps its contents off the Python heap.
+
+    @param file   (file) The file.
+    @param offset (int)  The offset at which the region starts.
+    @param length (int)  The region length.
+
+    @return (FileRegion/buffer) The segment.
+    """
+
+    if sendfile:
+        return FileRegion(file, offset, length)
+
+    return buffer(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ), offset, length)
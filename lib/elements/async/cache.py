@@ -0,0 +1,387 @@
+# This file is part of Elements.
+# Copyright (c) 2010 Sean Kerr. All rights reserved.
+#
+# The full license is available in the LICENSE file that was distributed with this source code.
+#
+# Author: Sean Kerr <sean@code-box.org>
+
+import cPickle
+import fcntl
+import mmap
+import struct
+import tempfile
+
+from time import time
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+CACHE_BUCKET     = struct.Struct("=Q")      # clock hand of a bucket
+CACHE_ENTRY      = struct.Struct("=QdBBHI") # hash, expiration time, flags, value type, key length, value length
+
+CACHE_FLAGS      = 16 # offset of the flags within an entry
+CACHE_REFERENCED = 2  # flag that indicates the entry has been read since the clock hand last passed it
+CACHE_USED       = 1  # flag that indicates the entry holds an item
+
+CACHE_INTEGER    = 1  # value type of an integer, which is stored as text so it can be incremented
+CACHE_PICKLE     = 2  # value type of any other object, which is stored pickled
+CACHE_STRING     = 0  # value type of a string, which is stored as is
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class SharedCache:
+
+    def __init__ (self, item_count=4096, item_size=256, ways=8):
+        """
+        Create a new SharedCache instance.
+
+        A shared cache is a fixed-capacity hash table in shared memory. It must be created before the server starts
+        its worker processes, and afterwards all processes read and write the same items.
+
+        The table is divided into buckets of a fixed number of entries, and a key can only be stored in the bucket its
+        hash selects. Each operation locks only that bucket, and when a bucket is full the clock hand of the bucket
+        evicts the first entry that hasn't been read since the hand last passed it.
+
+        Note: Buckets are locked with fcntl record locks, which the kernel releases when a process exits, so a worker
+              process that dies in the middle of an operation never leaves a bucket locked. Record locks are held per
+              process, so the cache must not be shared by threads within a process.
+
+        @param item_count (int) The total item capacity.
+        @param item_size  (int) The maximum combined length of a key and its encoded value.
+        @param ways       (int) The entry count of each bucket.
+        """
+
+        bucket_count = max(1, (item_count + ways - 1) / ways)
+        entry_size   = CACHE_ENTRY.size + item_size
+        bucket_size  = CACHE_BUCKET.size + ways * entry_size
+
+        self._bucket_count = bucket_count                              # count of buckets
+        self._bucket_size  = bucket_size                               # size of a bucket
+        self._entry_size   = entry_size                                # size of an entry
+        self._item_size    = item_size                                 # maximum combined size of a key and value
+        self._lock_file    = tempfile.TemporaryFile()                  # file that holds the bucket locks
+        self._map          = mmap.mmap(-1, bucket_count * bucket_size) # shared memory, inherited by forked processes
+        self._ways         = ways                                      # count of entries per bucket
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def close (self):
+        """
+        Release the shared memory and the lock file.
+        """
+
+        self._map.close()
+        self._lock_file.close()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def delete (self, key):
+        """
+        Delete an item.
+
+        @param key (str) The key.
+
+        @return (bool) True, if the item existed, otherwise False.
+        """
+
+        bucket, offset, hash = self.__bucket(key)
+
+        self.__lock(bucket)
+
+        try:
+            entry = self.__find(offset, hash, key)
+
+            if entry is None:
+                return False
+
+            CACHE_ENTRY.pack_into(self._map, entry, 0, 0, 0, 0, 0, 0)
+
+            return True
+
+        finally:
+            self.__unlock(bucket)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def get (self, key, default=None):
+        """
+        Retrieve an item.
+
+        @param key     (str)    The key.
+        @param default (object) The value to return if the item doesn't exist.
+
+        @return (object) The value.
+        """
+
+        map                  = self._map
+        bucket, offset, hash = self.__bucket(key)
+
+        self.__lock(bucket)
+
+        try:
+            entry = self.__find(offset, hash, key)
+
+            if entry is None:
+                return default
+
+            hash, expires, flags, kind, key_length, value_length = CACHE_ENTRY.unpack_from(map, entry)
+
+            map[entry + CACHE_FLAGS] = chr(flags | CACHE_REFERENCED)
+
+            start = entry + CACHE_ENTRY.size + key_length
+            value = map[start:start + value_length]
+
+        finally:
+            self.__unlock(bucket)
+
+        if kind == CACHE_STRING:
+            return value
+
+        if kind == CACHE_INTEGER:
+            return int(value)
+
+        return cPickle.loads(value)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def incr (self, key, delta=1, expire=0):
+        """
+        Increase an integer item, or create it with the delta as its value if it doesn't exist.
+
+        @param key    (str)   The key.
+        @param delta  (int)   The amount by which the value will be increased.
+        @param expire (float) The seconds until a created item expires, or 0 if it never expires. The expiration time of
+                              an existing item is left as is.
+
+        @return (int) The new value, or None if the existing value isn't an integer or the item is larger than the item
+                      size.
+        """
+
+        map                  = self._map
+        bucket, offset, hash = self.__bucket(key)
+
+        self.__lock(bucket)
+
+        try:
+            entry = self.__find(offset, hash, key)
+
+            if entry is None:
+                value = delta
+
+                if len(key) + len(str(value)) > self._item_size:
+                    return None
+
+                self.__store(self.__allocate(offset), hash, key, CACHE_INTEGER, str(value),
+                             time() + expire if expire else 0)
+
+                return value
+
+            hash, expires, flags, kind, key_length, value_length = CACHE_ENTRY.unpack_from(map, entry)
+
+            if kind != CACHE_INTEGER:
+                return None
+
+            start = entry + CACHE_ENTRY.size + key_length
+            value = int(map[start:start + value_length]) + delta
+            data  = str(value)
+
+            if key_length + len(data) > self._item_size:
+                return None
+
+            CACHE_ENTRY.pack_into(map, entry, hash, expires, flags | CACHE_REFERENCED, kind, key_length, len(data))
+
+            map[start:start + len(data)] = data
+
+            return value
+
+        finally:
+            self.__unlock(bucket)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def set (self, key, value, expire=0):
+        """
+        Store an item.
+
+        Strings are stored as is, integers are stored so that they can be increased with incr(), and all other values
+        are pickled.
+
+        @param key    (str)    The key.
+        @param value  (object) The value.
+        @param expire (float)  The seconds until the item expires, or 0 if it never expires.
+
+        @return (bool) True, if the item has been stored, otherwise False if it's larger than the item size.
+        """
+
+        if isinstance(value, str):
+            kind = CACHE_STRING
+            data = value
+
+        elif type(value) in (int, long):
+            kind = CACHE_INTEGER
+            data = str(value)
+
+        else:
+            kind = CACHE_PICKLE
+            data = cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL)
+
+        if len(key) + len(data) > self._item_size:
+            return False
+
+        bucket, offset, hash = self.__bucket(key)
+
+        self.__lock(bucket)
+
+        try:
+            entry = self.__find(offset, hash, key)
+
+            if entry is None:
+                entry = self.__allocate(offset)
+
+            self.__store(entry, hash, key, kind, data, time() + expire if expire else 0)
+
+            return True
+
+        finally:
+            self.__unlock(bucket)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __allocate (self, offset):
+        """
+        Find an entry for a new item, evicting an item if the bucket is full.
+
+        @param offset (int) The bucket offset.
+
+        @return (int) The entry offset.
+        """
+
+        map   = self._map
+        first = offset + CACHE_BUCKET.size
+        now   = None
+
+        for way in xrange(0, self._ways):
+            entry = first + way * self._entry_size
+
+            hash, expires, flags, kind, key_length, value_length = CACHE_ENTRY.unpack_from(map, entry)
+
+            if not flags & CACHE_USED:
+                return entry
+
+            if expires:
+                now = now or time()
+
+                if expires < now:
+                    return entry
+
+        # the bucket is full, so sweep the clock hand until it finds an entry that hasn't been read since its last pass,
+        # which happens within two rounds at most
+        hand = CACHE_BUCKET.unpack_from(map, offset)[0]
+
+        while True:
+            entry = first + hand * self._entry_size
+            flags = ord(map[entry + CACHE_FLAGS])
+            hand  = (hand + 1) % self._ways
+
+            if not flags & CACHE_REFERENCED:
+                CACHE_BUCKET.pack_into(map, offset, hand)
+
+                return entry
+
+            map[entry + CACHE_FLAGS] = chr(flags & ~CACHE_REFERENCED)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __bucket (self, key):
+        """
+        Retrieve the bucket of a key.
+
+        @param key (str) The key.
+
+        @return (tuple) A three-part tuple containing the bucket index, the bucket offset, and the key hash.
+        """
+
+        # the hash is the same in every process that forks from the one that created the cache
+        key_hash = hash(key) & 0xFFFFFFFFFFFFFFFF
+        bucket   = key_hash % self._bucket_count
+
+        return bucket, bucket * self._bucket_size, key_hash
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __find (self, offset, hash, key):
+        """
+        Find the entry of an item, removing it if it has expired.
+
+        @param offset (int) The bucket offset.
+        @param hash   (int) The key hash.
+        @param key    (str) The key.
+
+        @return (int) The entry offset, or None if the item doesn't exist.
+        """
+
+        map   = self._map
+        first = offset + CACHE_BUCKET.size
+
+        for way in xrange(0, self._ways):
+            entry = first + way * self._entry_size
+
+            entry_hash, expires, flags, kind, key_length, value_length = CACHE_ENTRY.unpack_from(map, entry)
+
+            if not flags & CACHE_USED or entry_hash != hash or key_length != len(key):
+                continue
+
+            start = entry + CACHE_ENTRY.size
+
+            if map[start:start + key_length] != key:
+                continue
+
+            if expires and expires < time():
+                CACHE_ENTRY.pack_into(map, entry, 0, 0, 0, 0, 0, 0)
+
+                return None
+
+            return entry
+
+        return None
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __lock (self, bucket):
+        """
+        Lock a bucket.
+
+        @param bucket (int) The bucket index.
+        """
+
+        fcntl.lockf(self._lock_file, fcntl.LOCK_EX, 1, bucket)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __store (self, entry, hash, key, kind, data, expires):
+        """
+        Write an item into an entry.
+
+        @param entry   (int)   The entry offset.
+        @param hash    (int)   The key hash.
+        @param key     (str)   The key.
+        @param kind    (int)   The value type.
+        @param data    (str)   The encoded value.
+        @param expires (float) The expiration time, or 0 if the item never expires.
+        """
+
+        start = entry + CACHE_ENTRY.size
+
+        CACHE_ENTRY.pack_into(self._map, entry, hash, expires, CACHE_USED, kind, len(key), len(data))
+
+        self._map[start:start + len(key) + len(data)] = key + data
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __unlock (self, bucket):
+        """
+        Unlock a bucket.
+
+        @param bucket (int) The bucket index.
+        """
+
+        fcntl.lockf(self._lock_file, fcntl.LOCK_UN, 1, bucket)
@@ -6,27 +6,60 @@
 # Author: Sean Kerr <sean@code-box.org>
 # Author: Noah Fontes <nfontes@invectorate.com>
 
-try:
-    import cStringIO as StringIO
-except:
-    import StringIO
-
+import cPickle
+import errno
+import fcntl
+import marshal
 import new
 import os
 import socket
+import struct
 import time
 
+from collections import deque
+from itertools   import islice
+
 import settings
 
+from elements.async.buffer  import BufferPool
+from elements.async.buffer  import FileRegion
+from elements.async.buffer  import file_segment
 from elements.core.exception import ChannelException
 from elements.core.exception import ClientException
 
+try:
+    from _multiprocessing import recvfd
+    from _multiprocessing import sendfd
+except ImportError:
+    recvfd = None
+    sendfd = None
+
 # ----------------------------------------------------------------------------------------------------------------------
 
+EAGER_WRITES   = False
+EDGE_TRIGGERED = False
+
 EVENT_LINGER = 0
 EVENT_READ   = 0
 EVENT_WRITE  = 0
 
+MESSAGE_CODECS = { "marshal": (marshal.dumps, marshal.loads),
+                   "pickle":  (lambda message: cPickle.dumps(message, cPickle.HIGHEST_PROTOCOL), cPickle.loads) }
+
+MESSAGE_NOTICE         = 0
+MESSAGE_REQUEST        = 1
+MESSAGE_RESPONSE       = 2
+MESSAGE_RESPONSE_ERROR = 3
+
+READ_BUFFER_POOL     = BufferPool()
+READ_COMPACT_SIZE    = 65535
+RING_POLL_INTERVAL   = 1
+STATS                = None
+WRITE_EAGER_SIZE     = 262144
+WRITE_GATHER_SIZE    = 65536
+WRITE_HIGH_WATERMARK = 1048576
+WRITE_LOW_WATERMARK  = 262144
+
 # ----------------------------------------------------------------------------------------------------------------------
 
 class ClientMetaclass (type):
@@ -71,19 +104,28 @@ class Client:
         self._client_socket    = client_socket          # client ip
         self._events           = EVENT_READ             # active events
         self._fileno           = client_socket.fileno() # file descriptor
+        self._hold_count       = 0                      # count of pool callbacks that will act upon this client
         self._is_channel       = False                  # indicates that this client is a channel
         self._is_host          = False                  # indicates that this client is a host
+        self._is_write_paused  = False                  # indicates that the write buffer has reached the high watermark
         self._last_access_time = time.time()            # last access time for this client
-        self._read_buffer      = StringIO.StringIO()    # incoming data buffer
+        self._producer         = None                   # iterator that generates outgoing data
+        self._read_buffer      = bytearray()            # incoming data buffer
         self._read_callback    = None                   # method to execute on the occurence of a read event
         self._read_delimiter   = None                   # needle to find in the incoming data buffer
+        self._read_index       = 0                      # read buffer index at which unconsumed data begins
         self._read_length      = None                   # length of data to read
         self._read_max_bytes   = None                   # maximum read buffer length when using read_delimiter()
+        self._read_scan_index  = 0                      # read buffer index at which the next delimiter scan begins
         self._read_size        = 4096                   # maximum bytes to read from the client socket
         self._server           = server                 # server instance
         self._server_address   = server_address         # server address
-        self._write_buffer     = StringIO.StringIO()    # outgoing data buffer
-        self._write_index      = 0                      # write buffer index
+        self._timeout_tick     = None                   # timing wheel tick at which this client will time out
+        self._write_buffer     = deque()                # outgoing data segments
+        self._write_high       = WRITE_HIGH_WATERMARK   # write buffer length at which writing is paused
+        self._write_index      = 0                      # index into the first outgoing data segment
+        self._write_length     = 0                      # length of all outgoing data that has not been written
+        self._write_low        = WRITE_LOW_WATERMARK    # write buffer length at which writing is resumed
 
         # disable blocking
         client_socket.setblocking(0)
@@ -104,9 +146,49 @@ class Client:
         Clear the write buffer.
         """
 
-        self._write_buffer.truncate(0)
+        self._write_buffer.clear()
+
+        self._is_write_paused = False
+        self._producer        = None
+        self._write_index     = 0
+        self._write_length    = 0
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def consume_read_buffer (self, length):
+        """
+        Remove data from the front of the read buffer.
+
+        @param length (int) The length of data to remove.
+
+        @return (str) The removed data.
+        """
+
+        buffer = self._read_buffer
+        index  = self._read_index
+
+        # slicing a memoryview copies the data once, where slicing the bytearray would copy it twice
+        data = memoryview(buffer)[index:index + length].tobytes()
+
+        index += length
+
+        if index >= len(buffer):
+            # the read buffer has been entirely consumed
+            del buffer[:]
+
+            index = 0
+
+        elif index >= READ_COMPACT_SIZE and index >= len(buffer) - index:
+            # note: we only compact once the consumed data outweighs the remainder, so the remainder is never copied
+            #       more than once per consumed byte
+            del buffer[:index]
 
-        self._write_index = 0
+            index = 0
+
+        self._read_index      = index
+        self._read_scan_index = index
+
+        return data
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -123,6 +205,16 @@ class Client:
 
     # ------------------------------------------------------------------------------------------------------------------
 
+    def handle_drain (self):
+        """
+        This callback will be executed when writing has been paused, and the write buffer has since drained down to the
+        low watermark.
+        """
+
+        pass
+
+    # ------------------------------------------------------------------------------------------------------------------
+
     def handle_error (self):
         """
         This callback will be executed when a read/write error has occurred.
@@ -132,6 +224,15 @@ class Client:
 
     # ------------------------------------------------------------------------------------------------------------------
 
+    def handle_flush (self):
+        """
+        This callback will be executed right before the write buffer is written to the socket.
+        """
+
+        pass
+
+    # ------------------------------------------------------------------------------------------------------------------
+
     def handle_max_bytes (self, max_bytes):
         """
         This callback will be executed when a maximum byte limit has been met.
@@ -150,21 +251,41 @@ class Client:
         This callback will be executed when read data is available.
         """
 
-        data = self._client_socket.recv(self._read_size)
+        while True:
+            # read into a scratch buffer that is shared by all clients, which saves allocating a new string every read
+            scratch = READ_BUFFER_POOL.get(self._read_size)
 
-        if len(data) == 0:
-            # the client closed the connection
-            self._events = 0
+            try:
+                length = self._client_socket.recv_into(scratch)
 
-            return
+            except socket.error, e:
+                if e[0] not in (errno.EWOULDBLOCK, errno.EAGAIN):
+                    raise
+
+                # the socket has been drained
+                return
+
+            if length == 0:
+                # the client closed the connection
+                self._events = 0
+
+                return
+
+            if STATS and not self._is_channel:
+                STATS.bytes_read += length
+
+            self._read_buffer += scratch[:length]
 
-        self._read_buffer.write(data)
+            if self._read_delimiter:
+                self.read_delimiter(self._read_delimiter, self._read_callback, self._read_max_bytes)
 
-        if self._read_delimiter:
-            self.read_delimiter(self._read_delimiter, self._read_callback, self._read_max_bytes)
+            elif self._read_length:
+                self.read_length(self._read_length, self._read_callback)
 
-        elif self._read_length:
-            self.read_length(self._read_length, self._read_callback)
+            if not EDGE_TRIGGERED or not self._events & EVENT_READ:
+                # level-triggered event managers will notify us again, and edge-triggered event managers will deliver a
+                # new notification when read events are modified back on
+                return
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -173,35 +294,57 @@ class Client:
         This callback will be executed when read data is available. All read data will be printed to console.
         """
 
-        data = self._client_socket.recv(self._read_size)
+        while True:
+            # read into a scratch buffer that is shared by all clients, which saves allocating a new string every read
+            scratch = READ_BUFFER_POOL.get(self._read_size)
 
-        if len(data) == 0:
-            # the client closed the connection
-            self._events = 0
+            try:
+                length = self._client_socket.recv_into(scratch)
 
-            return
+            except socket.error, e:
+                if e[0] not in (errno.EWOULDBLOCK, errno.EAGAIN):
+                    raise
+
+                # the socket has been drained
+                return
+
+            if length == 0:
+                # the client closed the connection
+                self._events = 0
+
+                return
+
+            if STATS and not self._is_channel:
+                STATS.bytes_read += length
 
-        print "> Data (%s:%d) %d bytes" % (self._client_address[0], self._client_address[1], len(data))
+            data = scratch[:length].tobytes()
 
-        if settings.io_display_data:
-            if settings.io_display_ord:
-                print ">>",
+            print "> Data (%s:%d) %d bytes" % (self._client_address[0], self._client_address[1], len(data))
 
-                for char in data:
-                    print "'%s' %d" % (self.debug_replace(char), ord(char)),
+            if settings.io_display_data:
+                if settings.io_display_ord:
+                    print ">>",
 
-                print
+                    for char in data:
+                        print "'%s' %d" % (self.debug_replace(char), ord(char)),
 
-            else:
-                print ">>", self.debug_replace(data)
+                    print
 
-        self._read_buffer.write(data)
+                else:
+                    print ">>", self.debug_replace(data)
 
-        if self._read_delimiter:
-            self.read_delimiter(self._read_delimiter, self._read_callback, self._read_max_bytes)
+            self._read_buffer += data
 
-        elif self._read_length:
-            self.read_length(self._read_length, self._read_callback)
+            if self._read_delimiter:
+                self.read_delimiter(self._read_delimiter, self._read_callback, self._read_max_bytes)
+
+            elif self._read_length:
+                self.read_length(self._read_length, self._read_callback)
+
+            if not EDGE_TRIGGERED or not self._events & EVENT_READ:
+                # level-triggered event managers will notify us again, and edge-triggered event managers will deliver a
+                # new notification when read events are modified back on
+                return
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -236,29 +379,54 @@ class Client:
         This callback will be executed when write data is available.
         """
 
-        buffer = self._write_buffer
-        data   = buffer.getvalue()
-        chunk  = data[self._write_index:]
-        length = self._client_socket.send(chunk)
+        segments = self._write_buffer
+
+        self.handle_flush()
+
+        while True:
+            if segments:
+                data = self.__gather_write_buffer()
+
+                try:
+                    length = self.__send(data)
+
+                except socket.error, e:
+                    if e[0] not in (errno.EWOULDBLOCK, errno.EAGAIN):
+                        raise
+
+                    # the socket buffer is full
+                    length = 0
 
-        # increase the write index (this helps cut back on small writes)
-        self._write_index += length
+                self.__consume_write_buffer(length)
+
+                if self._is_write_paused and self._write_length <= self._write_low:
+                    # the write buffer has drained enough for producers to resume
+                    self._is_write_paused = False
+
+                    if self._producer:
+                        self.__pull_producer()
+
+                    else:
+                        self.handle_drain()
+
+                if segments:
+                    if length < len(data) and (not EDGE_TRIGGERED or length == 0):
+                        # there is more data to write, but the socket buffer is full
+                        return
+
+                    continue
 
-        if length == len(chunk):
             # write buffer has been entirely written
             self._events &= ~EVENT_WRITE
 
             self.handle_write_finished()
 
-            return
-
-        # there is more data to write
-        # note: we speed up small writes by eliminating the seek/truncate/write on every call
-        if self._write_index >= 65535:
-            buffer.truncate(0)
-            buffer.write(data[self._write_index:])
+            if EDGE_TRIGGERED and segments and self._events & EVENT_WRITE:
+                # more data has been written, and an edge-triggered event manager will not notify us again until the
+                # socket buffer has filled up
+                continue
 
-            self._write_index = 0
+            return
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -267,43 +435,68 @@ class Client:
         This callback will be executed when write data is available.
         """
 
-        buffer = self._write_buffer
-        data   = buffer.getvalue()
-        chunk  = data[self._write_index:]
-        length = self._client_socket.send(chunk)
+        segments = self._write_buffer
+
+        self.handle_flush()
+
+        while True:
+            if segments:
+                data = self.__gather_write_buffer()
+
+                try:
+                    length = self.__send(data)
+
+                except socket.error, e:
+                    if e[0] not in (errno.EWOULDBLOCK, errno.EAGAIN):
+                        raise
+
+                    # the socket buffer is full
+                    length = 0
+
+                print "< Data (%s:%d) %d bytes" % (self._client_address[0], self._client_address[1], length)
+
+                if settings.io_display_data:
+                    if settings.io_display_ord:
+                        print "<<",
+
+                        for char in data[:length]:
+                            print "'%s' %d" % (self.debug_replace(char), ord(char)),
 
-        print "< Data (%s:%d) %d bytes" % (self._client_address[0], self._client_address[1], length)
+                        print
 
-        if settings.io_display_data:
-            if settings.io_display_ord:
-                print "<<",
+                    else:
+                        print "<<", self.debug_replace(data[:length])
 
-                for char in chunk[:length]:
-                    print "'%s' %d" % (self.debug_replace(char), ord(char)),
+                self.__consume_write_buffer(length)
 
-                print
+                if self._is_write_paused and self._write_length <= self._write_low:
+                    # the write buffer has drained enough for producers to resume
+                    self._is_write_paused = False
 
-            else:
-                print "<<", self.debug_replace(chunk[:length])
+                    if self._producer:
+                        self.__pull_producer()
 
-        # increase the write index (this helps cut back on small writes)
-        self._write_index += length
+                    else:
+                        self.handle_drain()
+
+                if segments:
+                    if length < len(data) and (not EDGE_TRIGGERED or length == 0):
+                        # there is more data to write, but the socket buffer is full
+                        return
+
+                    continue
 
-        if length == len(chunk):
             # write buffer has been entirely written
             self._events &= ~EVENT_WRITE
 
             self.handle_write_finished()
 
-            return
-
-        # there is more data to write
-        # note: we speed up small writes by eliminating the seek/truncate/write on every call
-        if self._write_index >= 65535:
-            buffer.truncate(0)
-            buffer.write(data[self._write_index:])
+            if EDGE_TRIGGERED and segments and self._events & EVENT_WRITE:
+                # more data has been written, and an edge-triggered event manager will not notify us again until the
+                # socket buffer has filled up
+                continue
 
-            self._write_index = 0
+            return
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -316,6 +509,21 @@ class Client:
 
     # ------------------------------------------------------------------------------------------------------------------
 
+    def is_writable_paused (self):
+        """
+        Retrieve the write pause status.
+
+        Producers that generate a large amount of data should stop writing once writing has been paused, and resume
+        when handle_drain() is executed.
+
+        @return (bool) True, if the write buffer has reached the high watermark and has not yet drained down to the low
+                       watermark, otherwise False.
+        """
+
+        return self._is_write_paused
+
+    # ------------------------------------------------------------------------------------------------------------------
+
     def read_delimiter (self, delimiter, callback, max_bytes=0):
         """
         Read until a certain delimiter has been found within the read buffer.
@@ -326,14 +534,23 @@ class Client:
         """
 
         buffer = self._read_buffer
-        data   = buffer.getvalue()
-        pos    = data.find(delimiter)
+        index  = self._read_index
+
+        if delimiter != self._read_delimiter:
+            # this is a new search, so the entire unconsumed buffer must be scanned
+            self._read_scan_index = index
+
+        # only scan the data that has arrived since the last scan, backing up far enough to catch a delimiter that was
+        # split between two reads
+        pos = buffer.find(delimiter, max(index, self._read_scan_index - len(delimiter) + 1))
 
         if pos > -1:
             # the delimiter has been found
             self._events         &= ~EVENT_READ
             self._read_delimiter  = None
 
+            pos -= index
+
             if max_bytes and pos > max_bytes:
                 # the maximum byte limit has been reached
                 if not self.handle_max_bytes(max_bytes):
@@ -342,17 +559,14 @@ class Client:
 
                     return
 
-            pos += len(delimiter)
-
-            buffer.truncate(0)
-            buffer.write(data[pos:])
-
-            callback(data[:pos])
+            callback(self.consume_read_buffer(pos + len(delimiter)))
 
             return
 
+        self._read_scan_index = len(buffer)
+
         # the delimiter still hasn't been sent
-        if max_bytes and len(data) >= max_bytes:
+        if max_bytes and len(buffer) - index >= max_bytes:
             # the maximum byte limit has been reached
             self._read_delimiter = None
 
@@ -379,18 +593,12 @@ class Client:
         @param callback (method) The callback to execute once the length has been read entirely.
         """
 
-        if self._read_buffer.tell() >= length:
+        if len(self._read_buffer) - self._read_index >= length:
             # the read buffer has met our length requirement
             self._events      &= ~EVENT_READ
             self._read_length  = None
 
-            buffer = self._read_buffer
-            data   = buffer.getvalue()
-
-            buffer.truncate(0)
-            buffer.write(data[length:])
-
-            callback(data[:length])
+            callback(self.consume_read_buffer(length))
 
             return
 
@@ -401,6 +609,22 @@ class Client:
 
     # ------------------------------------------------------------------------------------------------------------------
 
+    def set_write_watermarks (self, high, low):
+        """
+        Set the write buffer watermarks.
+
+        @param high (int) The write buffer length at which writing will be paused.
+        @param low  (int) The write buffer length at which writing will be resumed.
+        """
+
+        if low > high:
+            raise ClientException("The low watermark cannot be greater than the high watermark")
+
+        self._write_high = high
+        self._write_low  = low
+
+    # ------------------------------------------------------------------------------------------------------------------
+
     def write (self, data):
         """
         Append data onto the write buffer.
@@ -408,10 +632,197 @@ class Client:
         @param data (str) The data to write.
         """
 
-        self._write_buffer.write(data)
+        if data:
+            if isinstance(data, unicode):
+                data = str(data)
+
+            self._write_buffer.append(data)
+
+            self._write_length += len(data)
+
+            if EAGER_WRITES and self._write_length >= WRITE_EAGER_SIZE:
+                # there is enough data to make writing worthwhile before the handler returns
+                self.__send_write_buffer()
+
+            if self._write_length >= self._write_high:
+                self._is_write_paused = True
 
         self._events |= EVENT_WRITE
 
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def write_file (self, file, offset=0, length=None):
+        """
+        Append a region of a file onto the write buffer.
+
+        Note: The region is sent with sendfile() when it's available, otherwise it's sent from a memory-mapped view of
+              the file. Either way the file contents never pass through a Python string.
+
+        @param file   (file) The file, which will be kept open for as long as the write buffer references it.
+        @param offset (int)  The offset at which the region starts.
+        @param length (int)  The region length, or None to write until the end of the file.
+        """
+
+        if length is None:
+            length = os.fstat(file.fileno()).st_size - offset
+
+        if length > 0:
+            self.write(file_segment(file, offset, length))
+
+        else:
+            self._events |= EVENT_WRITE
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def write_producer (self, producer):
+        """
+        Write the data generated by a producer.
+
+        Data is pulled from the producer until writing has been paused, and pulling resumes each time the write buffer
+        drains, so the producer never has more than the high watermark worth of data waiting to be written.
+
+        @param producer (iterable) A generator, iterator or other iterable that generates the data to write.
+        """
+
+        self._producer = iter(producer)
+
+        self.__pull_producer()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __consume_write_buffer (self, length):
+        """
+        Remove written data from the front of the write buffer.
+
+        @param length (int) The length of data that has been written.
+        """
+
+        segments = self._write_buffer
+        index    = self._write_index + length
+
+        while segments and index >= len(segments[0]):
+            index -= len(segments.popleft())
+
+        self._write_index   = index
+        self._write_length -= length
+
+        if STATS and not self._is_channel:
+            STATS.bytes_written += length
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __gather_write_buffer (self):
+        """
+        Gather the data at the front of the write buffer so it can be written with a single send.
+
+        Note: Python 2 sockets have no sendmsg(), so small segments are joined into a single string of at most
+              WRITE_GATHER_SIZE bytes, and large segments are sent straight from a read-only view without being copied.
+              File regions are always sent on their own.
+
+        @return (str/buffer/FileRegion) The data to write.
+        """
+
+        segments = self._write_buffer
+        data     = segments[0]
+        index    = self._write_index
+
+        if data.__class__ is FileRegion:
+            if index:
+                return data.slice(index)
+
+            return data
+
+        if len(segments) == 1 or len(data) - index >= WRITE_GATHER_SIZE:
+            if index:
+                return buffer(data, index)
+
+            return data
+
+        data   = [data[index:]]
+        length = len(data[0])
+
+        for segment in islice(segments, 1, None):
+            if segment.__class__ is not str:
+                # file regions and views are only ever sent on their own
+                break
+
+            if length + len(segment) > WRITE_GATHER_SIZE:
+                # only copy as much of the segment as is needed to fill up the gather size
+                data.append(segment[:WRITE_GATHER_SIZE - length])
+
+                break
+
+            data.append(segment)
+
+            length += len(segment)
+
+        return "".join(data)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __pull_producer (self):
+        """
+        Pull data from the producer until writing has been paused or the producer has finished.
+        """
+
+        producer = self._producer
+
+        try:
+            while not self._is_write_paused:
+                self.write(producer.next())
+
+        except StopIteration:
+            # the producer has finished
+            self._producer = None
+
+        except:
+            # the producer has failed, and it won't be pulled again
+            self._producer = None
+
+            raise
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __send (self, data):
+        """
+        Send data from the write buffer.
+
+        @param data (str/buffer/FileRegion) The data to send.
+
+        @return (int) The number of bytes that have been sent.
+        """
+
+        if data.__class__ is FileRegion:
+            return data.send(self._client_socket)
+
+        return self._client_socket.send(data)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __send_write_buffer (self):
+        """
+        Write as much of the write buffer as the socket will accept, without executing any callbacks.
+
+        Note: Socket errors are left for handle_write() to discover, so writing never raises an exception.
+        """
+
+        segments = self._write_buffer
+
+        while segments:
+            data = self.__gather_write_buffer()
+
+            try:
+                length = self.__send(data)
+
+            except socket.error:
+                return
+
+            self.__consume_write_buffer(length)
+
+            if length < len(data):
+                # the socket buffer is full
+                return
+
 # ----------------------------------------------------------------------------------------------------------------------
 
 class ChannelClient (Client):
@@ -463,57 +874,850 @@ class BlockingChannelClient (ChannelClient):
 
 # ----------------------------------------------------------------------------------------------------------------------
 
-class HostClient (Client):
+class HandoffChannelClient (ChannelClient):
 
-    def __init__ (self, host_socket, host_address, server):
+    def __init__ (self, socket, pid, server):
         """
-        Create a new HostClient instance.
+        Create a new HandoffChannelClient instance.
 
-        @param host_socket  (socket) The host socket.
-        @param host_address (tuple)  A two-part tuple containing the host ip and port.
-        @param server       (Server) The Server instance within which this HostClient is being created.
+        A handoff channel connects the parent process to a worker process when the parent process accepts all
+        connections. The parent process passes each accepted connection to the worker process, and the worker process
+        reports its load back to the parent process.
+
+        @param socket (socket) The channel socket.
+        @param pid    (int)    The process id.
+        @param server (Server) The Server instance within which this HandoffChannelClient is being created.
         """
 
-        Client.__init__(self, host_socket, host_address, server, None)
+        ChannelClient.__init__(self, socket, pid, server)
 
-        self._handle_client = server.handle_client
-        self._is_host       = True
+        self._active_count   = 0 # count of connections the worker process is handling
+        self._received_count = 0 # count of connections the worker process has received
+        self._sent_count     = 0 # count of connections the parent process has sent
+
+        if server._is_parent:
+            self.read_delimiter("\n", self.handle_report)
 
     # ------------------------------------------------------------------------------------------------------------------
 
-    def handle_read (self):
+    def get_load (self):
         """
-        Accept a new client connection.
+        Retrieve the load of the worker process.
+
+        @return (int) The count of connections the worker process is handling, including the connections that have
+                      been sent but have not been received yet.
+        """
+
+        return self._active_count + self._sent_count - self._received_count
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def hand_off (self, client_socket):
         """
+        Pass a connection to the worker process.
 
-        client_socket, client_address = self._client_socket.accept()
+        @param client_socket (socket) The client socket.
+
+        @return (bool) True, if the connection has been passed, otherwise False.
+        """
 
         try:
-            self._handle_client(client_socket, client_address, self._client_address)
+            sendfd(self._fileno, client_socket.fileno())
 
-        except Exception, e:
-            client_socket.close()
+        except (OSError, socket.error), e:
+            if e[0] not in (errno.EWOULDBLOCK, errno.EAGAIN):
+                raise
 
-            raise ClientException("Cannot create client: %s" % e)
+            # the worker process has fallen too far behind
+            return False
+
+        self._sent_count += 1
+
+        return True
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def handle_read (self):
+        """
+        Receive connections from the parent process, or load reports from the worker process.
+        """
+
+        if self._server._is_parent:
+            Client.handle_read(self)
+
+            return
+
+        while True:
+            try:
+                if not self._client_socket.recv(1, socket.MSG_PEEK):
+                    # the parent process has exited
+                    self._events = 0
+
+                    return
+
+                fileno = recvfd(self._fileno)
+
+            except (OSError, socket.error), e:
+                if e[0] not in (errno.EWOULDBLOCK, errno.EAGAIN):
+                    raise
+
+                # the channel has been drained
+                return
+
+            self._received_count += 1
+
+            self.__handle_client(fileno)
 
     # ------------------------------------------------------------------------------------------------------------------
 
     def handle_read_debug (self):
         """
-        Accept a new client connection.
+        Receive connections from the parent process, or load reports from the worker process.
 
-        Note: This debugging method is an exact duplicate of HostClient.handle_read() and is only here because it's a
-              necessity during i/o debugging.
+        Note: This debugging method is an exact duplicate of HandoffChannelClient.handle_read() and is only here because
+              it's a necessity during i/o debugging.
         """
 
-        client_socket, client_address = self._client_socket.accept()
+        if self._server._is_parent:
+            Client.handle_read_debug(self)
 
-        print "> New client (%s:%d)" % client_address
+            return
 
-        try:
-            self._handle_client(client_socket, client_address, self._client_address)
+        while True:
+            try:
+                if not self._client_socket.recv(1, socket.MSG_PEEK):
+                    # the parent process has exited
+                    self._events = 0
 
-        except Exception, e:
-            client_socket.close()
+                    return
 
-            raise ClientException("Cannot create client: %s" % e)
+                fileno = recvfd(self._fileno)
+
+            except (OSError, socket.error), e:
+                if e[0] not in (errno.EWOULDBLOCK, errno.EAGAIN):
+                    raise
+
+                # the channel has been drained
+                return
+
+            print "> New handoff (%d)" % fileno
+
+            self._received_count += 1
+
+            self.__handle_client(fileno)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def handle_report (self, data):
+        """
+        This callback will be executed when the worker process has reported its load.
+
+        @param data (str) The report.
+        """
+
+        self._received_count, self._active_count = map(int, data.split())
+
+        self.read_delimiter("\n", self.handle_report)
+
+        server = self._server
+
+        if server._is_accept_paused and server._is_listening and self.get_load() == 0:
+            # a long-running worker process is idle again, so the parent process resumes accepting connections
+            server._is_accept_paused = False
+
+            for host in server._hosts:
+                server._event_manager.register(host._fileno, host._events)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def report (self, active_count):
+        """
+        Report the load of the worker process to the parent process.
+
+        @param active_count (int) The count of connections the worker process is handling.
+        """
+
+        self.write("%d %d\n" % (self._received_count, active_count))
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __handle_client (self, fileno):
+        """
+        Handle a connection that has been received from the parent process.
+
+        @param fileno (int) The file descriptor of the connection.
+        """
+
+        try:
+            client_socket = socket.fromfd(fileno, socket.AF_INET, socket.SOCK_STREAM)
+
+        finally:
+            os.close(fileno)
+
+        # neither a received descriptor nor its duplicate carries the close-on-exec flag
+        fcntl.fcntl(client_socket.fileno(), fcntl.F_SETFD, fcntl.FD_CLOEXEC)
+
+        try:
+            client_address = client_socket.getpeername()
+            server_address = client_socket.getsockname()
+
+        except socket.error:
+            # the client disconnected before it was received
+            client_socket.close()
+
+            return
+
+        try:
+            self._server.handle_client(client_socket, client_address, server_address)
+
+        except Exception, e:
+            client_socket.close()
+
+            raise ClientException("Cannot create client: %s" % e)
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class MessageChannelClient (ChannelClient):
+
+    def __init__ (self, socket, pid, server, codec="marshal"):
+        """
+        Create a new MessageChannelClient instance.
+
+        A message channel exchanges length-prefixed frames, each of which holds an encoded message. Messages are either
+        notices, which expect no reply, or requests, which are matched up with their response by a correlation id.
+
+        @param socket (socket) The channel socket.
+        @param pid    (int)    The process id.
+        @param server (Server) The Server instance within which this MessageChannelClient is being created.
+        @param codec  (str)    The message codec. One of marshal or pickle.
+        """
+
+        ChannelClient.__init__(self, socket, pid, server)
+
+        try:
+            self._dumps, self._loads = MESSAGE_CODECS[codec]
+
+        except KeyError:
+            raise ChannelException("Invalid message codec '%s'" % codec)
+
+        self._callbacks  = {} # callbacks of the requests that are waiting for a response
+        self._request_id = 0  # id of the most recent request
+
+        self.read_length(4, self.__handle_header)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def handle_frame (self, frame):
+        """
+        This callback will be executed when a frame has been received. The frame is decoded and the callback for its
+        message is executed.
+
+        @param frame (str) The frame.
+        """
+
+        kind, id, message = self._loads(frame)
+
+        if kind == MESSAGE_NOTICE:
+            self.handle_message(message)
+
+        elif kind == MESSAGE_REQUEST:
+            try:
+                response = self.handle_request(message)
+
+            except Exception, e:
+                self.__send(MESSAGE_RESPONSE_ERROR, id, str(e))
+
+                return
+
+            self.__send(MESSAGE_RESPONSE, id, response)
+
+        else:
+            callback = self._callbacks.pop(id, None)
+
+            if not callback:
+                return
+
+            if kind == MESSAGE_RESPONSE_ERROR:
+                message = ChannelException(message)
+
+            callback(message)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def handle_message (self, message):
+        """
+        This callback will be executed when a notice has been received.
+
+        @param message (object) The message.
+        """
+
+        self._server.handle_channel_message(self, message)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def handle_request (self, message):
+        """
+        This callback will be executed when a request has been received.
+
+        @param message (object) The message.
+
+        @return (object) The response.
+        """
+
+        return self._server.handle_channel_request(self, message)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def request (self, message, callback):
+        """
+        Send a request.
+
+        @param message  (object) The message.
+        @param callback (method) The callback to execute with the response once it has been received. If the request
+                                 failed on the other end, the callback receives a ChannelException instance instead.
+        """
+
+        self._request_id += 1
+
+        self._callbacks[self._request_id] = callback
+
+        self.__send(MESSAGE_REQUEST, self._request_id, message)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def send (self, message):
+        """
+        Send a notice.
+
+        @param message (object) The message.
+        """
+
+        self.__send(MESSAGE_NOTICE, 0, message)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def write_frame (self, frame):
+        """
+        Write a frame right away.
+
+        Note: Messages are often sent outside of the event handler of this channel, so the channel must update its own
+              events when the frame cannot be written entirely.
+
+        @param frame (str) The frame.
+        """
+
+        events = self._events
+
+        self.write(struct.pack("!I", len(frame)))
+        self.write(frame)
+        self.handle_write()
+
+        if self._events != events:
+            self._server.modify_client(self)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __handle_body (self, frame):
+        """
+        Dispatch a frame that took more than one read to arrive, and wait for the next frame.
+
+        @param frame (str) The frame.
+        """
+
+        self.handle_frame(frame)
+
+        self.read_length(4, self.__handle_header)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __handle_header (self, header):
+        """
+        Dispatch all frames that have been read entirely, and wait for the next frame.
+
+        Note: Frames are consumed in a loop instead of through read_length() callbacks, so a read that contains many
+              frames never results in deep recursion.
+
+        @param header (str) The frame header.
+        """
+
+        length = struct.unpack("!I", header)[0]
+
+        while True:
+            available = len(self._read_buffer) - self._read_index
+
+            if available < length:
+                self.read_length(length, self.__handle_body)
+
+                return
+
+            self.handle_frame(self.consume_read_buffer(length))
+
+            if available - length < 4:
+                self.read_length(4, self.__handle_header)
+
+                return
+
+            length = struct.unpack("!I", self.consume_read_buffer(4))[0]
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __send (self, kind, id, message):
+        """
+        Encode a message into a frame and write it.
+
+        @param kind    (int)    The message kind.
+        @param id      (int)    The correlation id.
+        @param message (object) The message.
+        """
+
+        self.write_frame(self._dumps((kind, id, message)))
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class RingChannelClient (MessageChannelClient):
+
+    def __init__ (self, socket, pid, server, codec, rings):
+        """
+        Create a new RingChannelClient instance.
+
+        A ring channel passes its frames through a pair of shared-memory ring buffers, and only uses the channel socket
+        as a doorbell that wakes up the other process when it has nothing left to read.
+
+        @param socket (socket) The channel socket.
+        @param pid    (int)    The process id.
+        @param server (Server) The Server instance within which this RingChannelClient is being created.
+        @param codec  (str)    The message codec. One of marshal or pickle.
+        @param rings  (tuple)  A two-part tuple containing the RingBuffer instance that is read by this process, and the
+                               RingBuffer instance that is written by this process.
+        """
+
+        MessageChannelClient.__init__(self, socket, pid, server, codec)
+
+        self._inbound, self._outbound = rings
+
+        self._is_shutdown = False   # indicates that this channel has been shutdown
+        self._pending     = deque() # frames waiting for room in the outbound ring
+
+        server.call_later(RING_POLL_INTERVAL, self.__handle_poll_timer)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def handle_read (self):
+        """
+        Empty the doorbell, then dispatch all frames in the inbound ring.
+        """
+
+        while True:
+            try:
+                data = self._client_socket.recv(4096)
+
+            except socket.error, e:
+                if e[0] not in (errno.EWOULDBLOCK, errno.EAGAIN):
+                    raise
+
+                break
+
+            if not data:
+                # the other process has exited
+                self._events = 0
+
+                return
+
+            if len(data) < 4096:
+                break
+
+        self.__read_ring()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def handle_read_debug (self):
+        """
+        Empty the doorbell, then dispatch all frames in the inbound ring.
+
+        Note: This debugging method is an exact duplicate of RingChannelClient.handle_read() and is only here because
+              it's a necessity during i/o debugging.
+        """
+
+        while True:
+            try:
+                data = self._client_socket.recv(4096)
+
+            except socket.error, e:
+                if e[0] not in (errno.EWOULDBLOCK, errno.EAGAIN):
+                    raise
+
+                break
+
+            if not data:
+                # the other process has exited
+                self._events = 0
+
+                return
+
+            print "> Doorbell (%d)" % len(data)
+
+            if len(data) < 4096:
+                break
+
+        self.__read_ring()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def handle_shutdown (self):
+        """
+        This callback will be executed when this RingChannelClient instance is shutting down.
+        """
+
+        self._is_shutdown = True
+
+        MessageChannelClient.handle_shutdown(self)
+
+        self._inbound.close()
+        self._outbound.close()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def write_frame (self, frame):
+        """
+        Append a frame to the outbound ring, or queue it until the ring has room.
+
+        @param frame (str) The frame.
+        """
+
+        if len(frame) + 4 > self._outbound._size:
+            raise ChannelException("Cannot send a %d byte frame through a %d byte ring" % (len(frame),
+                                                                                         self._outbound._size))
+
+        if self._pending or not self.__put(frame):
+            self._pending.append(frame)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __handle_poll_timer (self):
+        """
+        Check both rings and schedule the next check.
+
+        Note: A doorbell can be missed when both processes check the counters of a ring at the same instant, so this
+              check bounds the delay that a missed doorbell causes.
+        """
+
+        if self._is_shutdown:
+            return
+
+        self._server.call_later(RING_POLL_INTERVAL, self.__handle_poll_timer)
+
+        events = self._events
+
+        self.__read_ring()
+
+        if self._events == events or self._server._clients.get(self._fileno) is not self:
+            return
+
+        # timers are executed outside of the event loop, so the frame handlers' changes are passed on right away
+        if self._events:
+            self._server.modify_client(self)
+
+        else:
+            self._server.unregister_client(self)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __put (self, frame):
+        """
+        Append a frame to the outbound ring.
+
+        @param frame (str) The frame.
+
+        @return (bool) True, if the frame has been appended, otherwise False.
+        """
+
+        wake = self._outbound.put(frame)
+
+        if wake is None:
+            return False
+
+        if wake:
+            self.__ring_doorbell()
+
+        return True
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __read_ring (self):
+        """
+        Dispatch all frames in the inbound ring, and append as many pending frames to the outbound ring as it has room
+        for.
+        """
+
+        frames, wake = self._inbound.get()
+
+        if wake:
+            # the other process is waiting for room in the ring that has just been emptied
+            self.__ring_doorbell()
+
+        for frame in frames:
+            try:
+                self.handle_frame(frame)
+
+            except Exception, e:
+                # the frames have already been removed from the ring, so the remaining frames must still be dispatched
+                self._server.handle_exception(e, self)
+
+        pending = self._pending
+
+        while pending and self.__put(pending[0]):
+            pending.popleft()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __ring_doorbell (self):
+        """
+        Wake up the other process.
+        """
+
+        try:
+            self._client_socket.send("\0")
+
+        except socket.error, e:
+            if e[0] not in (errno.EWOULDBLOCK, errno.EAGAIN):
+                raise
+
+            # the doorbell is already full of wake up calls
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class ProcessPoolChannelClient (MessageChannelClient):
+
+    def __init__ (self, socket, pid, server, pool):
+        """
+        Create a new ProcessPoolChannelClient instance.
+
+        A process pool channel connects the event loop to one compute process of a process pool. Each function is sent
+        as a pickled request, and its result comes back as the response.
+
+        @param socket (socket)      The channel socket.
+        @param pid    (int)         The process id of the compute process.
+        @param server (Server)      The Server instance within which this ProcessPoolChannelClient is being created.
+        @param pool   (ProcessPool) The ProcessPool instance.
+        """
+
+        MessageChannelClient.__init__(self, socket, pid, server, "pickle")
+
+        self._pool = pool # process pool that owns the compute process
+        self._task = None # function the compute process is running
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def handle_response (self, response):
+        """
+        This callback will be executed when the compute process has returned the result of a function.
+
+        @param response (tuple) A three-part tuple containing an indicator of success, the return value of the function
+                                or the message of the exception it raised, and the number of seconds it ran.
+        """
+
+        self._pool.handle_response(self, response)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def handle_shutdown (self):
+        """
+        This callback will be executed when this ProcessPoolChannelClient instance is shutting down.
+        """
+
+        MessageChannelClient.handle_shutdown(self)
+
+        self._pool.handle_exited(self)
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class ThreadPoolClient (ChannelClient):
+
+    def __init__ (self, socket, server, pool):
+        """
+        Create a new ThreadPoolClient instance.
+
+        A thread pool client is the event loop end of the socket pair through which the threads of a thread pool wake
+        up the event loop when a function has returned.
+
+        @param socket (socket)     The loop end of the socket pair.
+        @param server (Server)     The Server instance within which this ThreadPoolClient is being created.
+        @param pool   (ThreadPool) The ThreadPool instance.
+        """
+
+        ChannelClient.__init__(self, socket, os.getpid(), server)
+
+        self._pool = pool
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def handle_read (self):
+        """
+        Empty the doorbell, then execute the callbacks of all functions that have returned.
+        """
+
+        while True:
+            try:
+                data = self._client_socket.recv(4096)
+
+            except socket.error, e:
+                if e[0] not in (errno.EWOULDBLOCK, errno.EAGAIN):
+                    raise
+
+                break
+
+            if not data:
+                # the thread pool has been closed
+                self._events = 0
+
+                return
+
+            if len(data) < 4096:
+                break
+
+        self._pool.handle_completed()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def handle_read_debug (self):
+        """
+        Empty the doorbell, then execute the callbacks of all functions that have returned.
+
+        Note: This debugging method is an exact duplicate of ThreadPoolClient.handle_read() and is only here because
+              it's a necessity during i/o debugging.
+        """
+
+        while True:
+            try:
+                data = self._client_socket.recv(4096)
+
+            except socket.error, e:
+                if e[0] not in (errno.EWOULDBLOCK, errno.EAGAIN):
+                    raise
+
+                break
+
+            if not data:
+                # the thread pool has been closed
+                self._events = 0
+
+                return
+
+            print "> Thread pool doorbell (%d)" % len(data)
+
+            if len(data) < 4096:
+                break
+
+        self._pool.handle_completed()
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class HostClient (Client):
+
+    def __init__ (self, host_socket, host_address, server):
+        """
+        Create a new HostClient instance.
+
+        @param host_socket  (socket) The host socket.
+        @param host_address (tuple)  A two-part tuple containing the host ip and port.
+        @param server       (Server) The Server instance within which this HostClient is being created.
+        """
+
+        Client.__init__(self, host_socket, host_address, server, None)
+
+        self._accept_count  = server._accept_count
+        self._handle_client = server.handle_client
+        self._is_host       = True
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def handle_read (self):
+        """
+        Accept new client connections, up to the accept count of the server.
+        """
+
+        accept_count = self._accept_count
+
+        while True:
+            try:
+                client_socket, client_address = self._client_socket.accept()
+
+            except socket.error, e:
+                if e[0] not in (errno.EWOULDBLOCK, errno.EAGAIN):
+                    raise
+
+                # another process accepted the connection, or the backlog has been drained
+                return
+
+            # python 2 has no accept4(), and a subprocess spawned by a handler must not inherit the connection
+            fcntl.fcntl(client_socket.fileno(), fcntl.F_SETFD, fcntl.FD_CLOEXEC)
+
+            try:
+                self._handle_client(client_socket, client_address, self._client_address)
+
+            except Exception, e:
+                client_socket.close()
+
+                raise ClientException("Cannot create client: %s" % e)
+
+            if self._server._is_long_running:
+                # long-running servers only handle one client at a time
+                return
+
+            accept_count -= 1
+
+            if not accept_count:
+                if EDGE_TRIGGERED:
+                    # the backlog may not be drained, so the host must be re-armed in order to be reported again
+                    self._server._event_manager_modify(self._fileno, self._events)
+
+                return
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def handle_read_debug (self):
+        """
+        Accept new client connections, up to the accept count of the server.
+
+        Note: This debugging method is an exact duplicate of HostClient.handle_read() and is only here because it's a
+              necessity during i/o debugging.
+        """
+
+        accept_count = self._accept_count
+
+        while True:
+            try:
+                client_socket, client_address = self._client_socket.accept()
+
+            except socket.error, e:
+                if e[0] not in (errno.EWOULDBLOCK, errno.EAGAIN):
+                    raise
+
+                # another process accepted the connection, or the backlog has been drained
+                return
+
+            # python 2 has no accept4(), and a subprocess spawned by a handler must not inherit the connection
+            fcntl.fcntl(client_socket.fileno(), fcntl.F_SETFD, fcntl.FD_CLOEXEC)
+
+            print "> New client (%s:%d)" % client_address
+
+            try:
+                self._handle_client(client_socket, client_address, self._client_address)
+
+            except Exception, e:
+                client_socket.close()
+
+                raise ClientException("Cannot create client: %s" % e)
+
+            if self._server._is_long_running:
+                # long-running servers only handle one client at a time
+                return
+
+            accept_count -= 1
+
+            if not accept_count:
+                if EDGE_TRIGGERED:
+                    # the backlog may not be drained, so the host must be re-armed in order to be reported again
+                    self._server._event_manager_modify(self._fileno, self._events)
+
+                return
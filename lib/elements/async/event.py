@@ -5,6 +5,7 @@
 #
 # Author: Sean Kerr <sean@code-box.org>
 
+import math
 import select
 
 from elements.core.exception import EventException
@@ -22,6 +23,8 @@ class EventManager:
 
         self._server = server
 
+        self.IS_EDGE_TRIGGERED = False
+
     # ------------------------------------------------------------------------------------------------------------------
 
     def modify (self, fileno, events):
@@ -36,9 +39,11 @@ class EventManager:
 
     # ------------------------------------------------------------------------------------------------------------------
 
-    def poll (self):
+    def poll (self, timeout=None):
         """
         Poll the event manager for more events.
+
+        @param timeout (float) The maximum number of seconds to wait for an event, or None to wait indefinitely.
         """
 
         raise EventException("EventManager.poll() must be overridden")
@@ -105,14 +110,16 @@ class KQueueEventManager (EventManager):
 
     # ------------------------------------------------------------------------------------------------------------------
 
-    def poll (self):
+    def poll (self, timeout=None):
         """
         Poll the event manager for more events.
+
+        @param timeout (float) The maximum number of seconds to wait for an event, or None to wait indefinitely.
         """
 
         events = {}
 
-        for event in self._kqueue.control(None, self._count, 0.5):
+        for event in self._kqueue.control(None, self._count, timeout):
             events[event.ident] = 0
 
             if event.flags & select.KQ_EV_ERROR:
@@ -191,12 +198,18 @@ class PollEventManager (EventManager):
 
     # ------------------------------------------------------------------------------------------------------------------
 
-    def poll (self):
+    def poll (self, timeout=None):
         """
         Poll the event manager for more events.
+
+        @param timeout (float) The maximum number of seconds to wait for an event, or None to wait indefinitely.
         """
 
-        return self._poll.poll(0.5)
+        if timeout is None:
+            return self._poll.poll()
+
+        # poll() takes a timeout in milliseconds, and rounding down would cause a busy loop right before a deadline
+        return self._poll.poll(int(math.ceil(timeout * 1000)))
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -241,6 +254,64 @@ class EPollEventManager (PollEventManager):
         self.EVENT_WRITE  = select.EPOLLOUT
         self.EVENT_LINGER = select.EPOLLHUP
 
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def poll (self, timeout=None):
+        """
+        Poll the event manager for more events.
+
+        @param timeout (float) The maximum number of seconds to wait for an event, or None to wait indefinitely.
+        """
+
+        if timeout is None:
+            return self._poll.poll()
+
+        # epoll_wait() takes a timeout in milliseconds, and rounding down would cause a busy loop right before a deadline
+        return self._poll.poll(math.ceil(timeout * 1000) / 1000.0)
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class EdgeEPollEventManager (EPollEventManager):
+
+    def __init__ (self, server):
+        """
+        Create a new EdgeEPollEventManager instance.
+
+        Note: Edge-triggered notifications are only delivered when a file descriptor becomes ready, so clients must
+              read and write until the socket would block. Re-arming a file descriptor with modify() will deliver a
+              new notification if it is still ready.
+
+        @param server (Server) The Server instance under which this EdgeEPollEventManager is being created.
+        """
+
+        EPollEventManager.__init__(self, server)
+
+        self.IS_EDGE_TRIGGERED = True
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def modify (self, fileno, events):
+        """
+        Modify the event list for a file descriptor.
+
+        @param fileno (int) The file descriptor.
+        @param events (int) The events.
+        """
+
+        self._poll.modify(fileno, events | select.EPOLLET)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def register (self, fileno, events):
+        """
+        Register events for a file descriptor.
+
+        @param fileno (int) The file descriptor.
+        @param events (int) The events.
+        """
+
+        self._poll.register(fileno, events | select.EPOLLET)
+
 # ----------------------------------------------------------------------------------------------------------------------
 
 class SelectEventManager (EventManager):
@@ -293,15 +364,17 @@ class SelectEventManager (EventManager):
 
     # ------------------------------------------------------------------------------------------------------------------
 
-    def poll (self):
+    def poll (self, timeout=None):
         """
         Poll the event manager for more events.
+
+        @param timeout (float) The maximum number of seconds to wait for an event, or None to wait indefinitely.
         """
 
         events = {}
 
         read_filenos, write_filenos, error_filenos = select.select(self._read_filenos, self._write_filenos,
-                                                                   self._error_filenos, 0.5)
+                                                                   self._error_filenos, timeout)
 
         for fileno in read_filenos:
             events[fileno] = self.EVENT_READ
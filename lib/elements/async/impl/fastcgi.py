@@ -306,6 +306,20 @@ class _OutputWriter (object):
 
     # ------------------------------------------------------------------------------------------------------------------
 
+    def is_paused (self):
+        """
+        Whether the client has paused writing until its write buffer drains.
+
+        Producers that generate a large amount of output should stop writing while this is true, and resume from
+        FastcgiClient#handle_drain(). The request will not end until the producer has finished.
+
+        @return (bool) True if writing has been paused; false otherwise.
+        """
+
+        return self._client.is_writable_paused()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
     def writelines (self, sequence):
         """
         Writes a sequence of data to the client.
@@ -381,6 +395,8 @@ class FastcgiClient (Client):
         self._maximum_requests        = None                             # the maximum number of requests this client
                                                                          # will accept
         self._handled_requests        = 0                                # number of requests processed so far
+        self._end_request_status      = None                             # status of a request that will end once a
+                                                                         # paused producer has finished
         self._persistence_requested   = True                             # whether the server wants to use persistence
                                                                          # for further requests
 
@@ -496,6 +512,20 @@ class FastcgiClient (Client):
 
     # ------------------------------------------------------------------------------------------------------------------
 
+    def handle_write_finished (self):
+        """
+        Callback raised when the entire write buffer has been written. If the current request was waiting on a paused
+        producer, the producer has finished and the request can end.
+        """
+
+        if self._end_request_status is not None:
+            status                   = self._end_request_status
+            self._end_request_status = None
+
+            self._write_record(_EndRequestRecord(status, FCGI_REQUEST_COMPLETE, self.request_id))
+
+    # ------------------------------------------------------------------------------------------------------------------
+
     def _maybe_dispatch (self):
         """
         Dispatches the current request if the server has completed sending FCGI_PARAMS and FCGI_STDIN records, otherwise
@@ -516,6 +546,12 @@ class FastcgiClient (Client):
             self.stdin.truncate(0)
             self._has_stdin = False
 
+            if self.is_writable_paused():
+                # the producer will continue writing from handle_drain(), so the request ends once it has finished
+                self._end_request_status = 0 if status is None else status
+
+                return
+
             self._write_record(_EndRequestRecord(0 if status is None else status, FCGI_REQUEST_COMPLETE, self.request_id))
 
         else:
@@ -719,7 +755,6 @@ class FastcgiClient (Client):
             self.request_id = FCGI_NULL_REQUEST_ID
 
             if self._is_allowing_persistence and self._persistence_requested:
-                self.clear_write_buffer()
                 self._read_record()
 
             else:
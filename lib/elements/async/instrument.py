@@ -0,0 +1,187 @@
+# This file is part of Elements.
+# Copyright (c) 2010 Sean Kerr. All rights reserved.
+#
+# The full license is available in the LICENSE file that was distributed with this source code.
+#
+# Author: Sean Kerr <sean@code-box.org>
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+HISTOGRAM_BUCKETS = 26 # bucket n counts durations below 2^n microseconds, and the last bucket counts everything above
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class Histogram:
+
+    def __init__ (self):
+        """
+        Create a new Histogram instance.
+
+        A histogram counts durations in fixed power-of-two buckets, so recording a duration never allocates memory and
+        takes the same time no matter how many durations have been recorded.
+        """
+
+        self.buckets = [0] * HISTOGRAM_BUCKETS # count of durations per bucket
+        self.count   = 0                       # count of durations
+        self.max     = 0.0                     # longest duration in seconds
+        self.total   = 0.0                     # sum of all durations in seconds
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def record (self, elapsed):
+        """
+        Record a duration.
+
+        @param elapsed (float) The duration in seconds.
+        """
+
+        index = int(elapsed * 1000000).bit_length()
+
+        if index >= HISTOGRAM_BUCKETS:
+            index = HISTOGRAM_BUCKETS - 1
+
+        self.buckets[index] += 1
+        self.count          += 1
+        self.total          += elapsed
+
+        if elapsed > self.max:
+            self.max = elapsed
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def to_dict (self):
+        """
+        Retrieve the histogram as a dict of plain values, which can be marshalled or converted to json.
+
+        @return (dict) The bucket counts, count, longest duration and total duration.
+        """
+
+        return { "buckets": self.buckets[:], "count": self.count, "max": self.max, "total": self.total }
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class Instrumentation:
+
+    def __init__ (self):
+        """
+        Create a new Instrumentation instance.
+
+        Instrumentation keeps a histogram of the time spent in each phase of the event loop, and in each callback of
+        each client class.
+        """
+
+        self._clients    = {} # histograms of the read, write and error callbacks of each client class
+        self._histograms = {} # histograms by name
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def dump (self):
+        """
+        Render all histograms as a text table.
+
+        @return (str) The table.
+        """
+
+        lines = ["%-48s %10s %10s %10s %10s %10s" % ("name", "count", "mean ms", "p50 ms", "p99 ms", "max ms")]
+
+        for name, histogram in sorted(self.to_dict().items()):
+            lines.append("%-48s %10d %10.3f %10.3f %10.3f %10.3f" % ((name,) + summarize(histogram)))
+
+        return "\n".join(lines)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def get (self, name):
+        """
+        Retrieve a histogram, creating it if it doesn't exist.
+
+        @param name (str) The histogram name.
+
+        @return (Histogram) The Histogram instance.
+        """
+
+        try:
+            return self._histograms[name]
+
+        except KeyError:
+            histogram = self._histograms[name] = Histogram()
+
+            return histogram
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def get_client (self, client_class):
+        """
+        Retrieve the callback histograms of a client class, creating them if they don't exist.
+
+        @param client_class (class) The client class.
+
+        @return (dict) The histograms of handle_error(), handle_read() and handle_write() by callback name.
+        """
+
+        try:
+            return self._clients[client_class]
+
+        except KeyError:
+            name      = client_class.__name__
+            callbacks = self._clients[client_class] = {}
+
+            for callback in ("handle_error", "handle_read", "handle_write"):
+                callbacks[callback] = self.get(name + "." + callback)
+
+            return callbacks
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def to_dict (self):
+        """
+        Retrieve all histograms that have recorded a duration.
+
+        @return (dict) The histograms by name, each as a dict of plain values.
+        """
+
+        return dict([(name, histogram.to_dict()) for name, histogram in self._histograms.items() if histogram.count])
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def percentile (histogram, fraction):
+    """
+    Estimate a percentile of a histogram.
+
+    @param histogram (dict)  The histogram as a dict of plain values.
+    @param fraction  (float) The percentile as a fraction between 0 and 1.
+
+    @return (float) The upper bound in seconds of the bucket that holds the percentile, or the longest duration if the
+                    percentile is in the last bucket.
+    """
+
+    target = histogram["count"] * fraction
+    seen   = 0
+
+    for index, count in enumerate(histogram["buckets"]):
+        seen += count
+
+        if count and seen >= target:
+            if index == HISTOGRAM_BUCKETS - 1:
+                break
+
+            return min((1 << index) / 1000000.0, histogram["max"])
+
+    return histogram["max"]
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def summarize (histogram):
+    """
+    Summarize a histogram.
+
+    @param histogram (dict) The histogram as a dict of plain values.
+
+    @return (tuple) A five-part tuple containing the count, and the mean, median, 99th percentile and longest duration
+                    in milliseconds.
+    """
+
+    count = histogram["count"]
+
+    return (count, histogram["total"] * 1000 / max(count, 1), percentile(histogram, 0.5) * 1000,
+            percentile(histogram, 0.99) * 1000, histogram["max"] * 1000)
@@ -0,0 +1,673 @@
+# This file is part of Elements.
+# Copyright (c) 2010 Sean Kerr. All rights reserved.
+#
+# The full license is available in the LICENSE file that was distributed with this source code.
+#
+# Author: Sean Kerr <sean@code-box.org>
+
+import cPickle
+import errno
+import os
+import Queue
+import signal
+import socket
+import struct
+import threading
+
+from collections import deque
+from time        import time
+
+from elements.async.client     import Client
+from elements.async.client     import MESSAGE_CODECS
+from elements.async.client     import MESSAGE_RESPONSE
+from elements.async.client     import ProcessPoolChannelClient
+from elements.async.client     import ThreadPoolClient
+from elements.async.instrument import Histogram
+from elements.core.exception   import ChannelException
+from elements.core.exception   import ServerException
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+REAP_INTERVAL = 0.1
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class Pool:
+
+    def __init__ (self, server, name):
+        """
+        Create a new Pool instance.
+
+        A pool runs functions outside of the event loop, and each callback is executed by the event loop once its
+        function has returned.
+
+        @param server (Server) The Server instance within which this Pool is being created.
+        @param name   (str)    The pool name, which prefixes the names of its histograms.
+        """
+
+        self._failed_count  = 0                                  # count of functions that raised an exception
+        self._linger        = server._event_manager.EVENT_LINGER # event that keeps a waiting client registered
+        self._pending_count = 0                                  # count of functions whose callback hasn't run
+        self._server        = server                             # server instance
+        self._task_count    = 0                                  # count of functions whose callback has run
+
+        if server._instrument:
+            # the timings are published along with the other histograms
+            self._run_histogram  = server._instrument.get(name + " run")
+            self._wait_histogram = server._instrument.get(name + " wait")
+
+        else:
+            self._run_histogram  = Histogram()
+            self._wait_histogram = Histogram()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def execute_callback (self, callback, client, result):
+        """
+        Execute the callback of a function that has returned, and update the events of the client it acts upon.
+
+        @param callback (method) The callback.
+        @param client   (Client) The client the callback acts upon, or None.
+        @param result   (object) The return value of the function, or the exception instance it raised.
+        """
+
+        server = self._server
+
+        self._pending_count -= 1
+        self._task_count    += 1
+
+        if isinstance(result, Exception):
+            self._failed_count += 1
+
+        if client:
+            events = client._events
+
+            client._hold_count -= 1
+
+            if not client._hold_count:
+                client._events &= ~self._linger
+
+        try:
+            callback(result)
+
+        except Exception, e:
+            # an unhandled exception has been caught
+            server.handle_exception(e, client)
+
+        if not client or client._events == events or server._clients.get(client._fileno) is not client:
+            return
+
+        # the callback was executed outside of the event handling of its client, so its events are updated here
+        if client._events == 0:
+            server.unregister_client(client)
+
+        else:
+            server.modify_client(client)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def get_metrics (self):
+        """
+        Retrieve the pool metrics.
+
+        @return (dict) The count of functions whose callback hasn't been executed, the counts of finished and failed
+                       functions, and the histograms of the time functions waited to run and the time they ran.
+        """
+
+        return { "failed":  self._failed_count,
+                 "pending": self._pending_count,
+                 "run":     self._run_histogram.to_dict(),
+                 "tasks":   self._task_count,
+                 "wait":    self._wait_histogram.to_dict() }
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def hold_client (self, client):
+        """
+        Keep a client registered until the callback that acts upon it has been executed.
+
+        Note: The event loop unregisters a client without events once its own event has been handled, which is usually
+              the case for a client that waits for the result of a function before it writes a response. The count of
+              callbacks held is kept on the client, so a client can tell that its response isn't finished yet.
+
+        @param client (Client) The client.
+        """
+
+        client._hold_count += 1
+
+        client._events |= self._linger
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class ProcessPool (Pool):
+
+    def __init__ (self, server, process_count=2, queue_size=1024):
+        """
+        Create a new ProcessPool instance.
+
+        A process pool runs cpu-heavy functions on a fixed set of compute processes, which are forked from the process
+        that creates the pool and never serve clients. Functions and their results are pickled and passed over a
+        message channel to each compute process, and each compute process runs one function at a time, so functions
+        wait in a bounded queue within the event loop until a compute process is idle.
+
+        Note: The pool must be created before the process serves clients, because the compute processes inherit all
+              open descriptors and close them. A compute process that exits is replaced, and the callback of the
+              function it was running receives a ChannelException instance.
+
+        @param server        (Server) The Server instance within which this ProcessPool is being created.
+        @param process_count (int)    The compute process count.
+        @param queue_size    (int)    The maximum count of functions waiting for a compute process.
+        """
+
+        Pool.__init__(self, server, "process pool")
+
+        self._channels      = []            # channels of all compute processes
+        self._exited        = []            # process ids of the compute processes that haven't been reaped
+        self._idle          = []            # channels of the compute processes that aren't running a function
+        self._is_closed     = False         # indicates that the pool has been closed
+        self._process_count = process_count # count of compute processes
+        self._queue         = deque()       # functions waiting for a compute process
+        self._queue_size    = queue_size    # maximum count of functions waiting for a compute process
+        self._restart_count = 0             # count of compute processes that have been replaced
+
+        for i in xrange(0, process_count):
+            self.__spawn()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def close (self):
+        """
+        Discard the functions still waiting, and close the channels, which makes each compute process exit once it has
+        finished its current function.
+        """
+
+        self._is_closed = True
+
+        self._queue.clear()
+
+        for channel in self._channels:
+            try:
+                channel._client_socket.close()
+
+            except:
+                pass
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def defer (self, func, args, callback, client=None):
+        """
+        Execute a function on a compute process, and execute a callback with its result from the event loop.
+
+        @param func     (method) The function, which must be defined at the top level of a module so it can be pickled.
+        @param args     (tuple)  The function arguments, which must be picklable.
+        @param callback (method) The callback to execute with the return value of the function. If the function raised
+                                 an exception, the callback receives a ChannelException instance instead.
+        @param client   (Client) The client the callback acts upon, which has its events updated after the callback has
+                                 been executed. When this is None and the callback is a method of a client, that client
+                                 is used.
+        """
+
+        if self._is_closed:
+            raise ServerException("Cannot defer to process, because the process pool has been closed")
+
+        if not self._idle and len(self._queue) >= self._queue_size:
+            raise ServerException("Cannot defer to process, because the process pool queue is full")
+
+        try:
+            # pickle the function right away, so a function that cannot be passed to a compute process fails here
+            data = cPickle.dumps((func, args), cPickle.HIGHEST_PROTOCOL)
+
+        except Exception, e:
+            raise ServerException("Cannot defer to process: %s" % e)
+
+        if client is None and isinstance(getattr(callback, "im_self", None), Client):
+            client = callback.im_self
+
+        task = (data, callback, client, time())
+
+        if self._idle:
+            self.__send(self._idle.pop(), task)
+
+        else:
+            self._queue.append(task)
+
+        self._pending_count += 1
+
+        if client:
+            self.hold_client(client)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def get_metrics (self):
+        """
+        Retrieve the process pool metrics.
+
+        @return (dict) The pool metrics, along with the compute process count, the count of functions waiting for a
+                       compute process, and the count of compute processes that have been replaced.
+        """
+
+        metrics = Pool.get_metrics(self)
+
+        metrics["processes"]   = self._process_count
+        metrics["queue_depth"] = len(self._queue)
+        metrics["restarts"]    = self._restart_count
+
+        return metrics
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def handle_exited (self, channel):
+        """
+        This callback will be executed when the channel of a compute process has been shutdown.
+
+        @param channel (ProcessPoolChannelClient) The channel.
+        """
+
+        if channel in self._idle:
+            self._idle.remove(channel)
+
+        if channel in self._channels:
+            self._channels.remove(channel)
+
+        if self._is_closed:
+            return
+
+        # the compute process is reaped and replaced from a timer, because it may not have finished exiting yet, and a
+        # fork shouldn't happen in the middle of an event handler
+        if not self._exited:
+            self._server.call_later(0, self.__handle_reap_timer)
+
+        self._exited.append(channel._pid)
+
+        if channel._task:
+            data, callback, client, submitted = channel._task
+
+            self.execute_callback(callback, client,
+                                  ChannelException("Compute process %d exited while running a function" % channel._pid))
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def handle_response (self, channel, response):
+        """
+        This callback will be executed when a compute process has returned the result of a function.
+
+        @param channel  (ProcessPoolChannelClient) The channel.
+        @param response (tuple)                    A three-part tuple containing an indicator of success, the return
+                                                   value of the function or the message of the exception it raised,
+                                                   and the number of seconds it ran.
+        """
+
+        data, callback, client, submitted = channel._task
+
+        channel._task = None
+
+        is_success, result, elapsed = response
+
+        self._run_histogram.record(elapsed)
+
+        # hand the compute process its next function before the callback runs
+        self.__dispatch(channel)
+
+        self.execute_callback(callback, client, result if is_success else ChannelException(result))
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __dispatch (self, channel):
+        """
+        Send the next waiting function to an idle compute process.
+
+        @param channel (ProcessPoolChannelClient) The channel.
+        """
+
+        if self._queue:
+            self.__send(channel, self._queue.popleft())
+
+        else:
+            self._idle.append(channel)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __handle_reap_timer (self):
+        """
+        Reap the compute processes that have exited, replace them, and schedule the next check if any are left.
+        """
+
+        for pid in self._exited[:]:
+            try:
+                if not os.waitpid(pid, os.WNOHANG)[0]:
+                    # the compute process is still exiting
+                    continue
+
+            except OSError:
+                # the compute process has already been reaped
+                pass
+
+            self._exited.remove(pid)
+
+            if self._is_closed:
+                continue
+
+            self._restart_count += 1
+
+            self.__spawn()
+
+        if self._exited:
+            self._server.call_later(REAP_INTERVAL, self.__handle_reap_timer)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __receive (self, process_socket, length):
+        """
+        Read a certain length of data from the channel of this compute process.
+
+        @param process_socket (socket) The compute process end of the channel.
+        @param length         (int)    The length to read.
+
+        @return (str) The data, or None if the channel has been closed.
+        """
+
+        data = ""
+
+        while len(data) < length:
+            try:
+                chunk = process_socket.recv(length - len(data))
+
+            except socket.error, e:
+                if e[0] == errno.EINTR:
+                    continue
+
+                raise
+
+            if not chunk:
+                return None
+
+            data += chunk
+
+        return data
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __send (self, channel, task):
+        """
+        Send a function to a compute process.
+
+        @param channel (ProcessPoolChannelClient) The channel.
+        @param task    (tuple)                    The pickled function and arguments, callback, client, and the time at
+                                                  which the function was deferred.
+        """
+
+        self._wait_histogram.record(time() - task[3])
+
+        channel._task = task
+
+        channel.request(task[0], channel.handle_response)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __serve (self, process_socket):
+        """
+        Run functions until the channel of this compute process has been closed.
+
+        @param process_socket (socket) The compute process end of the channel.
+        """
+
+        dumps, loads = MESSAGE_CODECS["pickle"]
+
+        while True:
+            header = self.__receive(process_socket, 4)
+
+            if not header:
+                return
+
+            frame = self.__receive(process_socket, struct.unpack("!I", header)[0])
+
+            if frame is None:
+                return
+
+            kind, id, data = loads(frame)
+            started        = time()
+
+            try:
+                func, args = cPickle.loads(data)
+                response   = (True, func(*args))
+
+            except Exception, e:
+                response = (False, str(e))
+
+            elapsed = time() - started
+
+            try:
+                frame = dumps((MESSAGE_RESPONSE, id, response + (elapsed,)))
+
+            except Exception, e:
+                frame = dumps((MESSAGE_RESPONSE, id, (False, "Cannot pickle the return value: %s" % e, elapsed)))
+
+            process_socket.sendall(struct.pack("!I", len(frame)) + frame)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __spawn (self):
+        """
+        Spawn a compute process.
+        """
+
+        server                      = self._server
+        pool_socket, process_socket = socket.socketpair()
+
+        pid = os.fork()
+
+        if pid:
+            process_socket.close()
+            pool_socket.setblocking(0)
+
+            channel = ProcessPoolChannelClient(pool_socket, pid, server, self)
+
+            self._channels.append(channel)
+
+            server.register_client(channel)
+
+            self.__dispatch(channel)
+
+            return
+
+        # initialization from compute process perspective
+        try:
+            pool_socket.close()
+
+            # the compute process only needs its own end of the channel, and an inherited client socket would keep the
+            # connection open after the serving process has closed it
+            for client in server._clients.values():
+                try:
+                    client._client_socket.close()
+
+                except:
+                    pass
+
+            for host in server._hosts:
+                try:
+                    host._client_socket.close()
+
+                except:
+                    pass
+
+            # the compute process exits once the serving process closes the channel, so it ignores the signals that are
+            # meant for the serving processes
+            signal.signal(signal.SIGINT,  signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+            signal.signal(signal.SIGUSR2, signal.SIG_IGN)
+
+            self.__serve(process_socket)
+
+        except Exception, e:
+            server.handle_exception(e)
+
+        finally:
+            os._exit(0)
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class ThreadPool (Pool):
+
+    def __init__ (self, server, thread_count=8, queue_size=1024):
+        """
+        Create a new ThreadPool instance.
+
+        A thread pool runs blocking functions on a fixed set of threads, so the event loop keeps serving other clients
+        in the meantime. Threads only run the functions, and each callback is executed by the event loop once its
+        function has returned, after a thread wakes up the loop through a socket pair that is registered as a client.
+
+        Note: The threads must be started in the process that uses them, because threads do not survive a fork.
+
+        @param server       (Server) The Server instance within which this ThreadPool is being created.
+        @param thread_count (int)    The thread count.
+        @param queue_size   (int)    The maximum count of functions waiting for a thread.
+        """
+
+        Pool.__init__(self, server, "thread pool")
+
+        loop_socket, thread_socket = socket.socketpair()
+
+        thread_socket.setblocking(0)
+
+        self._completed     = deque()                 # functions that have returned, waiting for their callback
+        self._is_woken      = False                   # indicates that the event loop has been woken up
+        self._queue         = Queue.Queue(queue_size) # functions waiting for a thread
+        self._thread_count  = thread_count            # count of threads
+        self._thread_socket = thread_socket           # socket through which threads wake up the event loop
+
+        server.register_client(ThreadPoolClient(loop_socket, server, self))
+
+        for i in xrange(0, thread_count):
+            thread = threading.Thread(target=self.__run, name="elements-pool-%d" % i)
+
+            thread.daemon = True
+
+            thread.start()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def close (self):
+        """
+        Stop all threads once they have finished their current function, and discard the functions still waiting.
+        """
+
+        while True:
+            try:
+                self._queue.get_nowait()
+
+            except Queue.Empty:
+                break
+
+        for i in xrange(0, self._thread_count):
+            try:
+                self._queue.put_nowait(None)
+
+            except Queue.Full:
+                break
+
+        self._thread_socket.close()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def defer (self, func, args, callback, client=None):
+        """
+        Execute a function on a thread, and execute a callback with its result from the event loop.
+
+        @param func     (method) The function.
+        @param args     (tuple)  The function arguments.
+        @param callback (method) The callback to execute with the return value of the function. If the function raised
+                                 an exception, the callback receives the exception instance instead.
+        @param client   (Client) The client the callback acts upon, which has its events updated after the callback has
+                                 been executed. When this is None and the callback is a method of a client, that client
+                                 is used.
+        """
+
+        if client is None and isinstance(getattr(callback, "im_self", None), Client):
+            client = callback.im_self
+
+        try:
+            self._queue.put_nowait((func, args, callback, client, time()))
+
+        except Queue.Full:
+            raise ServerException("Cannot defer to thread, because the thread pool queue is full")
+
+        self._pending_count += 1
+
+        if client:
+            self.hold_client(client)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def get_metrics (self):
+        """
+        Retrieve the thread pool metrics.
+
+        @return (dict) The pool metrics, along with the thread count and the count of functions waiting for a thread.
+        """
+
+        metrics = Pool.get_metrics(self)
+
+        metrics["queue_depth"] = self._queue.qsize()
+        metrics["threads"]     = self._thread_count
+
+        return metrics
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def handle_completed (self):
+        """
+        Execute the callbacks of all functions that have returned.
+
+        Note: This is executed by the event loop after a thread has woken it up.
+        """
+
+        # clear the flag before taking results, so a function that returns from now on wakes up the loop again
+        self._is_woken = False
+
+        completed = self._completed
+
+        while completed:
+            callback, client, result, submitted, started, finished = completed.popleft()
+
+            self._run_histogram.record(finished - started)
+            self._wait_histogram.record(started - submitted)
+
+            self.execute_callback(callback, client, result)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __run (self):
+        """
+        Execute functions until the thread pool is closed.
+        """
+
+        while True:
+            task = self._queue.get()
+
+            if task is None:
+                return
+
+            func, args, callback, client, submitted = task
+
+            started = time()
+
+            try:
+                result = func(*args)
+
+            except Exception, e:
+                result = e
+
+            self._completed.append((callback, client, result, submitted, started, time()))
+
+            if self._is_woken:
+                continue
+
+            self._is_woken = True
+
+            try:
+                self._thread_socket.send("\0")
+
+            except socket.error:
+                # the doorbell is already full of wake up calls, or the thread pool has been closed
+                pass
@@ -0,0 +1,112 @@
+# This file is part of Elements.
+# Copyright (c) 2010 Sean Kerr. All rights reserved.
+#
+# The full license is available in the LICENSE file that was distributed with this source code.
+#
+# Author: Sean Kerr <sean@code-box.org>
+
+import signal
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class SamplingProfiler:
+
+    def __init__ (self, interval=0.01, max_stacks=10000, max_depth=64):
+        """
+        Create a new SamplingProfiler instance.
+
+        A sampling profiler asks the kernel for a SIGPROF each time the process has used another interval of cpu time,
+        and counts the stack that was running when the signal arrived. Nothing is traced between samples, so the
+        timing of the profiled code is left as is, and an idle process isn't sampled at all.
+
+        Note: Memory is bounded by the maximum count of distinct stacks, and samples of new stacks beyond it are only
+              counted as dropped. System calls interrupted by a sample are restarted.
+
+        @param interval   (float) The number of cpu seconds between samples.
+        @param max_stacks (int)   The maximum count of distinct stacks.
+        @param max_depth  (int)   The maximum count of frames per stack, counting from the innermost frame.
+        """
+
+        self._counts     = {}         # sample count of each stack, keyed by a tuple of code objects
+        self._dropped    = 0          # count of samples that didn't fit
+        self._interval   = interval   # cpu seconds between samples
+        self._max_depth  = max_depth  # maximum count of frames per stack
+        self._max_stacks = max_stacks # maximum count of distinct stacks
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def start (self):
+        """
+        Start sampling.
+        """
+
+        signal.signal(signal.SIGPROF, self.__sample)
+
+        # restart the system calls the signal interrupts, so blocking calls made by handlers never fail with EINTR
+        signal.siginterrupt(signal.SIGPROF, False)
+
+        signal.setitimer(signal.ITIMER_PROF, self._interval, self._interval)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def stop (self):
+        """
+        Stop sampling.
+        """
+
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_IGN)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def write (self, path):
+        """
+        Write the samples as folded stacks, one stack per line with its frames from the outermost to the innermost
+        separated by semicolons, followed by its sample count. This is the input format of flame graph tools.
+
+        @param path (str) The file path.
+        """
+
+        file = open(path, "w")
+
+        try:
+            for codes, count in self._counts.iteritems():
+                frames = ["%s (%s:%d)" % (code.co_name, code.co_filename, code.co_firstlineno)
+                          for code in reversed(codes)]
+
+                file.write("%s %d\n" % (";".join(frames), count))
+
+            if self._dropped:
+                file.write("[dropped] %d\n" % self._dropped)
+
+        finally:
+            file.close()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __sample (self, code, frame):
+        """
+        Count the stack that was running when the signal arrived.
+
+        @param code  (int)    The signal code.
+        @param frame (object) The stack frame.
+        """
+
+        codes = []
+
+        while frame is not None and len(codes) < self._max_depth:
+            codes.append(frame.f_code)
+
+            frame = frame.f_back
+
+        codes  = tuple(codes)
+        counts = self._counts
+
+        if codes in counts:
+            counts[codes] += 1
+
+        elif len(counts) < self._max_stacks:
+            counts[codes] = 1
+
+        else:
+            self._dropped += 1
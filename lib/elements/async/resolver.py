@@ -0,0 +1,127 @@
+# This file is part of Elements.
+# Copyright (c) 2010 Sean Kerr. All rights reserved.
+#
+# The full license is available in the LICENSE file that was distributed with this source code.
+#
+# Author: Sean Kerr <sean@code-box.org>
+
+import socket
+
+from time import time
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class Resolver:
+
+    def __init__ (self, server, ttl=300, max_size=4096):
+        """
+        Create a new Resolver instance.
+
+        A resolver looks up hostnames on a thread pool thread, so a slow name server never blocks the event loop, and
+        keeps each address for a fixed number of seconds. Concurrent lookups of the same hostname share one lookup.
+
+        Note: Failed lookups are not kept, so the next lookup of the same hostname asks the name server again.
+
+        @param server   (Server) The Server instance within which this Resolver is being created.
+        @param ttl      (int)    The number of seconds an address is kept.
+        @param max_size (int)    The maximum count of addresses kept.
+        """
+
+        self._cache    = {}       # address and expiration time of each hostname
+        self._max_size = max_size # maximum count of addresses kept
+        self._pending  = {}       # callbacks waiting for each hostname that is being looked up
+        self._server   = server   # server instance
+        self._ttl      = ttl      # seconds an address is kept
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def resolve (self, host, callback):
+        """
+        Resolve a hostname to an ip address.
+
+        Note: The callback is executed right away when the hostname is an ip address or its address is kept, otherwise
+              it's executed from the event loop once the lookup has finished.
+
+        @param host     (str)    The hostname.
+        @param callback (method) The callback to execute with the ip address. If the lookup failed, the callback
+                                 receives the exception instance instead.
+        """
+
+        try:
+            # an ip address needs no lookup
+            socket.inet_aton(host)
+
+            callback(host)
+
+            return
+
+        except socket.error:
+            pass
+
+        entry = self._cache.get(host)
+
+        if entry and entry[1] > time():
+            callback(entry[0])
+
+            return
+
+        if host in self._pending:
+            self._pending[host].append(callback)
+
+            return
+
+        self._pending[host] = [callback]
+
+        self._server.defer_to_thread(self.__lookup, (host,), self.__handle_lookup)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __handle_lookup (self, result):
+        """
+        Keep the address of a hostname that has been looked up, and execute the callbacks waiting for it.
+
+        @param result (tuple) A two-part tuple containing the hostname, and the ip address or the exception instance.
+        """
+
+        host, address = result
+
+        if not isinstance(address, Exception):
+            now = time()
+
+            if len(self._cache) >= self._max_size:
+                # drop the expired addresses, or all addresses if none has expired
+                for name, entry in self._cache.items():
+                    if entry[1] <= now:
+                        del self._cache[name]
+
+                if len(self._cache) >= self._max_size:
+                    self._cache.clear()
+
+            self._cache[host] = (address, now + self._ttl)
+
+        for callback in self._pending.pop(host, ()):
+            try:
+                callback(address)
+
+            except Exception, e:
+                # an unhandled exception has been caught
+                self._server.handle_exception(e)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __lookup (self, host):
+        """
+        Look up a hostname.
+
+        Note: This is executed on a thread pool thread.
+
+        @param host (str) The hostname.
+
+        @return (tuple) A two-part tuple containing the hostname, and the ip address or the exception instance.
+        """
+
+        try:
+            return host, socket.gethostbyname(host)
+
+        except Exception, e:
+            return host, e
@@ -6,6 +6,7 @@
 # Author: Sean Kerr <sean@code-box.org>
 
 import errno
+import heapq
 import os
 import platform
 import select
@@ -16,17 +17,32 @@ import traceback
 
 from time import time
 
-from elements.async          import client
-from elements.async.client   import ChannelClient
-from elements.async.client   import HostClient
-from elements.async.event    import EPollEventManager
-from elements.async.event    import KQueueEventManager
-from elements.async.event    import PollEventManager
-from elements.async.event    import SelectEventManager
-from elements.core.exception import ChannelException
-from elements.core.exception import ElementsException
-from elements.core.exception import HostException
-from elements.core.exception import ServerException
+from elements.async            import client
+from elements.async.buffer     import BufferPool
+from elements.async.buffer     import RingBuffer
+from elements.async.client     import ChannelClient
+from elements.async.client     import HandoffChannelClient
+from elements.async.client     import HostClient
+from elements.async.client     import MessageChannelClient
+from elements.async.client     import RingChannelClient
+from elements.async.event      import EdgeEPollEventManager
+from elements.async.event      import EPollEventManager
+from elements.async.event      import KQueueEventManager
+from elements.async.event      import PollEventManager
+from elements.async.event      import SelectEventManager
+from elements.async.instrument import Instrumentation
+from elements.async.pool       import ProcessPool
+from elements.async.pool       import ThreadPool
+from elements.async.profiler   import SamplingProfiler
+from elements.async.resolver   import Resolver
+from elements.async.stats      import StatsBlock
+from elements.async.timer      import Timer
+from elements.async.timer      import TimingWheel
+from elements.async.watchdog   import Watchdog
+from elements.core.exception   import ChannelException
+from elements.core.exception   import ElementsException
+from elements.core.exception   import HostException
+from elements.core.exception   import ServerException
 
 # ----------------------------------------------------------------------------------------------------------------------
 
@@ -34,7 +50,10 @@ class Server:
 
     def __init__ (self, hosts=None, daemonize=False, user=None, group=None, umask=None, chroot=None, long_running=False,
                   loop_interval=1, timeout=None, timeout_interval=10, worker_count=0, channel_count=0,
-                  event_manager=None, print_settings=True):
+                  event_manager=None, print_settings=True, eager_writes=True, reuseport=False, accept_count=64,
+                  acceptor=False, channel_codec=None, ring_size=0, stats=False, instrument=False, slow_callback=None,
+                  profile_path=None, profile_interval=0.01, thread_count=8, thread_queue=1024, process_count=0,
+                  process_queue=1024, resolve_ttl=300):
         """
         Create a new Server instance.
 
@@ -51,39 +70,110 @@ class Server:
         @param timeout_interval (int)       The interval between checks for client timeouts.
         @param worker_count     (int)       The worker process count.
         @param channel_count    (int)       The communication channel count for each worker.
-        @param event_manager    (str)       The event manager.
+        @param event_manager    (str)       The event manager. One of epoll, epoll-et (edge-triggered epoll), kqueue, poll
+                                            or select.
         @param print_settings   (bool)      Indicates that the server settings should be printed to the console.
+        @param eager_writes     (bool)      Indicates that client data should be written as soon as the client
+                                            handler returns, rather than after the next poll reports the client as
+                                            writable.
+        @param reuseport        (bool)      Indicates that each worker process should listen on its own SO_REUSEPORT
+                                            host sockets, so the kernel load-balances new connections between workers
+                                            instead of waking all of them.
+        @param accept_count     (int)       The maximum number of connections each host accepts per event loop
+                                            iteration, or 0 for no limit.
+        @param acceptor         (bool)      Indicates that the parent process should accept all connections and pass
+                                            each one to the least-loaded worker process.
+        @param channel_codec    (str)       The message codec for worker channels. One of marshal or pickle. When this
+                                            is None, channels carry raw data.
+        @param ring_size        (int)       The size of the shared-memory ring buffer in each direction of each worker
+                                            channel. When this is 0, messages are sent through the channel sockets.
+        @param stats            (bool)      Indicates that each process should count its connections, requests, bytes
+                                            and errors in shared memory, where any process can read them.
+        @param instrument       (bool)      Indicates that each process should record the time spent in each phase of
+                                            the event loop and in each client callback into histograms, which are
+                                            printed on SIGUSR1 and published with the stats.
+        @param slow_callback    (float)     The number of seconds after which a client or timer callback is reported as
+                                            slow, along with the stack at which it was running, or None to not watch
+                                            for slow callbacks.
+        @param profile_path     (str)       The path of the folded-stack file each process writes when its sampling
+                                            profiler is stopped, in which %d is replaced by the process id, or None to
+                                            disable the profiler. The profiler is started and stopped with profile(),
+                                            or by sending SIGUSR2 to the parent process.
+        @param profile_interval (float)     The number of cpu seconds between profiler samples.
+        @param thread_count     (int)       The thread count of the thread pool that runs the functions passed to
+                                            defer_to_thread(). Each process starts its pool when it first defers.
+        @param thread_queue     (int)       The maximum count of functions waiting for a thread pool thread.
+        @param process_count    (int)       The count of compute processes that each serving process forks to run the
+                                            functions passed to defer_to_process(), or 0 to disable compute processes.
+        @param process_queue    (int)       The maximum count of functions waiting for a compute process.
+        @param resolve_ttl      (int)       The number of seconds the address of a hostname passed to resolve() is kept.
         """
 
+        self._accept_count             = accept_count     # maximum connections accepted per host per loop iteration
+        self._acceptor                 = acceptor         # indicates that the parent process accepts all connections
+        self._active_count             = 0                # count of regular clients
         self._channels                 = {}               # worker channels
+        self._channel_codec            = channel_codec    # message codec for worker channels
         self._channel_count            = channel_count    # count of channels to be created
         self._chroot                   = chroot           # process chroot
         self._clients                  = {}               # all active clients
+        self._eager_writes             = eager_writes     # indicates that client data is written right away
         self._event_manager            = None             # event manager instance
         self._event_manager_modify     = None             # event manager modify method
         self._event_manager_poll       = None             # event manager poll method
         self._event_manager_register   = None             # event manager register method
         self._event_manager_unregister = None             # event manager unregister method
         self._group                    = group            # process group
+        self._handoff                  = None             # worker handoff channel to the parent process
+        self._handoffs                 = {}               # parent handoff channels to each worker process
         self._hosts                    = []               # host client/server sockets
+        self._instrument               = None             # histograms of the time spent in the event loop
+        self._is_accept_paused         = False            # indicates that the parent process waits for an idle worker
         self._is_daemon                = daemonize        # indicates that this is running as a daemon
         self._is_graceful_shutdown     = False            # indicates that the current shutdown request is graceful
         self._is_listening             = False            # indicates that this process is listening on all hosts
         self._is_long_running          = long_running     # indicates that clients are long-running
         self._is_parent                = True             # indicates that this process is the parent
+        self._is_profiling             = False            # indicates that the sampling profiler is running
+        self._is_reporting             = False            # indicates that a load report has been scheduled
         self._is_shutting_down         = False            # indicates that this server is shutting down
+        self._is_stopped               = False            # indicates that the event loop has finished
         self._loop_interval            = loop_interval    # the interval in seconds between calling handle_loop()
         self._parent_pid               = os.getpid()      # the parent process id
         self._print_settings           = print_settings   # indicates that the settings should be printed to the console
+        self._process_count            = process_count    # count of compute processes of each serving process
+        self._process_pool             = None             # compute process pool of this process
+        self._process_queue            = process_queue    # maximum count of functions waiting for a compute process
+        self._profile_interval         = profile_interval # cpu seconds between profiler samples
+        self._profile_path             = profile_path     # path of the folded-stack file written by each process
+        self._profiler                 = None             # sampling profiler of this process
+        self._resolve_ttl              = resolve_ttl      # seconds the address of a resolved hostname is kept
+        self._resolver                 = None             # hostname resolver of this process
+        self._reuseport                = reuseport        # indicates that each worker listens on its own host sockets
+        self._ring_size                = ring_size        # size of each shared-memory channel ring
+        self._slow_callback            = slow_callback    # seconds after which a callback is reported as slow
+        self._stats                    = None             # shared-memory counters of all processes
+        self._stats_slot               = None             # counters of this process
+        self._stats_slots              = {}               # stats slot index of each worker process
+        self._thread_count             = thread_count     # count of thread pool threads
+        self._thread_pool              = None             # thread pool of this process
+        self._thread_queue             = thread_queue     # maximum count of functions waiting for a thread
         self._timeout                  = timeout          # the timeout in seconds for a client to be removed
         self._timeout_interval         = timeout_interval # the interval in seconds between checking for idle clients
+        self._timeout_wheel            = None             # timing wheel that tracks idle clients
+        self._timer_sequence           = 0                # timer sequence used to order timers with equal deadlines
+        self._timers                   = []               # heap of pending timers
         self._umask                    = umask            # process umask
         self._user                     = user             # process user
+        self._watchdog                 = None             # watchdog that captures the stack of slow callbacks
         self._worker_count             = worker_count     # count of worker processes
         self._workers                  = []               # list of worker process ids
 
         # choose event manager
-        if hasattr(select, "epoll") and (event_manager is None or event_manager == "epoll"):
+        if hasattr(select, "epoll") and event_manager == "epoll-et":
+            self._event_manager = EdgeEPollEventManager
+
+        elif hasattr(select, "epoll") and (event_manager is None or event_manager == "epoll"):
             self._event_manager = EPollEventManager
 
         elif hasattr(select, "kqueue") and (event_manager is None or event_manager == "kqueue"):
@@ -103,6 +193,29 @@ class Server:
         else:
             raise ServerException("Could not find a suitable event manager for your platform")
 
+        if reuseport and not hasattr(socket, "SO_REUSEPORT"):
+            raise ServerException("Cannot reuse ports, because this platform does not support SO_REUSEPORT")
+
+        if reuseport and user:
+            # the kernel only lets sockets owned by the same user share a port, and workers bind after the user change
+            raise ServerException("Cannot reuse ports when changing the process user")
+
+        if acceptor and not client.sendfd:
+            raise ServerException("Cannot pass connections to workers, because this platform does not support it")
+
+        if channel_codec and channel_codec not in client.MESSAGE_CODECS:
+            raise ServerException("Invalid channel codec '%s'" % channel_codec)
+
+        if ring_size and not channel_codec:
+            raise ServerException("Cannot pass channel data through rings without a channel codec")
+
+        if acceptor and reuseport:
+            raise ServerException("Cannot pass connections to workers when each worker listens on its own hosts")
+
+        if timeout:
+            # idle clients are tracked in a timing wheel that turns once every [timeout interval] seconds
+            self._timeout_wheel = TimingWheel(timeout, timeout_interval)
+
         # change directory
         if chroot:
             try:
@@ -134,6 +247,18 @@ class Server:
 
             self.handle_post_daemonize()
 
+        if instrument:
+            self._instrument = Instrumentation()
+
+        if slow_callback:
+            self._watchdog = Watchdog(slow_callback)
+
+        if stats:
+            # the parent process counts in the first slot, and each worker process in a slot of its own, and when
+            # instrumented each slot has room to publish its histograms
+            self._stats      = StatsBlock(self._worker_count + 1, 65536 if instrument else 0)
+            self._stats_slot = self._stats.get_slot(0)
+
         # initialize the event manager methods and events
         self._event_manager            = self._event_manager(self)
         self._event_manager_modify     = self._event_manager.modify
@@ -146,9 +271,12 @@ class Server:
         self.EVENT_WRITE  = self._event_manager.EVENT_WRITE
 
         # update the client module with the proper events
-        client.EVENT_LINGER = self._event_manager.EVENT_LINGER
-        client.EVENT_READ   = self._event_manager.EVENT_READ
-        client.EVENT_WRITE  = self._event_manager.EVENT_WRITE
+        client.EAGER_WRITES   = eager_writes
+        client.EDGE_TRIGGERED = self._event_manager.IS_EDGE_TRIGGERED
+        client.EVENT_LINGER   = self._event_manager.EVENT_LINGER
+        client.EVENT_READ     = self._event_manager.EVENT_READ
+        client.EVENT_WRITE    = self._event_manager.EVENT_WRITE
+        client.STATS          = self._stats_slot
 
         # add all hosts
         if hosts:
@@ -189,51 +317,209 @@ class Server:
         signal.signal(signal.SIGINT,  self.handle_signal)
         signal.signal(signal.SIGTERM, self.handle_signal)
 
+        if instrument and platform.system() != "Windows":
+            signal.signal(signal.SIGUSR1, self.__handle_instrument_signal)
+
+        if profile_path and platform.system() != "Windows":
+            signal.signal(signal.SIGUSR2, self.__handle_profile_signal)
+
     # ------------------------------------------------------------------------------------------------------------------
 
     def add_host (self, ip, port):
         """
         Add a host.
 
+        Note: When ports are reused, the parent process only binds the host socket so the address is reserved and
+              verified. Each worker process listens on its own host socket once it has been spawned.
+
+              When the parent process is the acceptor, it listens on the host socket and worker processes never see it.
+
         @param ip   (str) A hostname or ip address.
         @param port (int) The port.
 
         @return (HostClient) The HostClient instance.
         """
 
-        try:
-            host = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        client = HostClient(self.__create_host_socket(ip, port, not self._reuseport or self._worker_count == 0),
+                            (ip, port), self)
 
-            # disable blocking
-            host.setblocking(0)
+        if self._acceptor and self._worker_count > 0:
+            # the parent process passes each connection to a worker process instead of handling it
+            client._handle_client = self.__hand_off
 
-            host.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            host.bind((ip, port))
-            host.listen(socket.SOMAXCONN)
+        self._hosts.append(client)
 
-            client = HostClient(host, (ip, port), self)
+        return client
 
-            self._hosts.append(client)
+    # ------------------------------------------------------------------------------------------------------------------
 
-            return client
+    def broadcast (self, message, channel_index=0):
+        """
+        Send a message to all worker processes.
 
-        except socket.error, e:
-            raise HostException("Cannot add host on ip '%s' port '%d': %s" % (ip, port, e[1]))
+        @param message       (object) The message.
+        @param channel_index (int)    The channel index.
+        """
+
+        if not self._is_parent:
+            raise ChannelException("Only the parent process can broadcast")
+
+        if not self._channel_codec:
+            raise ChannelException("Cannot broadcast messages over channels without a codec")
+
+        for channels in self._channels.values():
+            try:
+                channel = channels[channel_index]
+
+            except IndexError:
+                raise ChannelException("Invalid channel index")
+
+            channel.send(message)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def call_at (self, deadline, callback, *args):
+        """
+        Execute a callback at a specific time.
+
+        Note: Callbacks are executed outside of the event handler of any client, so a callback that changes the events
+              of a client must pass them on with modify_client().
+
+        @param deadline (float)  The time (as returned by time.time()) at which the callback will be executed.
+        @param callback (method) The callback.
+        @param args     (tuple)  The callback arguments.
+
+        @return (Timer) The Timer instance, which can be used to cancel the callback.
+        """
+
+        timer = Timer(deadline, callback, args)
+
+        self._timer_sequence += 1
+
+        heapq.heappush(self._timers, (deadline, self._timer_sequence, timer))
+
+        return timer
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def call_later (self, delay, callback, *args):
+        """
+        Execute a callback after a delay.
+
+        Note: Callbacks are executed outside of the event handler of any client, so a callback that changes the events
+              of a client must pass them on with modify_client().
+
+        @param delay    (int/float) The delay in seconds.
+        @param callback (method)    The callback.
+        @param args     (tuple)     The callback arguments.
+
+        @return (Timer) The Timer instance, which can be used to cancel the callback.
+        """
+
+        return self.call_at(time() + delay, callback, *args)
 
     # ------------------------------------------------------------------------------------------------------------------
 
-    def handle_channels (self, pid, sockets):
+    def defer_to_process (self, func, args, callback, client=None):
+        """
+        Execute a cpu-heavy function on a compute process, and execute a callback with its result from the event loop,
+        so the event loop keeps serving other clients while the function runs.
+
+        Note: The function and its arguments are pickled, so the function must be defined at the top level of a module.
+              When all compute processes are busy and the queue is full, a ServerException is raised, so a handler
+              can reject the request instead of piling up work.
+
+        @param func     (method) The function.
+        @param args     (tuple)  The function arguments.
+        @param callback (method) The callback to execute with the return value of the function. If the function raised
+                                 an exception, the callback receives a ChannelException instance instead.
+        @param client   (Client) The client the callback acts upon, which has its events updated after the callback has
+                                 been executed. When this is None and the callback is a method of a client, that client
+                                 is used.
+        """
+
+        if not self._process_pool:
+            raise ServerException("Cannot defer to process, because this process has no compute processes")
+
+        self._process_pool.defer(func, args, callback, client)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def defer_to_thread (self, func, args, callback, client=None):
+        """
+        Execute a blocking function on a thread pool thread, and execute a callback with its result from the event
+        loop, so the event loop keeps serving other clients while the function runs.
+
+        Note: The function must not touch clients or the server, since it runs outside of the event loop.
+
+              A handler can defer the work of a response and write the response from the callback. The client stays
+              registered until the callback has been executed, and an http client doesn't finish its response while
+              a callback is pending, so the callback can still write content after the handler has written the
+              headers. The response is finished once the callback has written.
+
+        @param func     (method) The function.
+        @param args     (tuple)  The function arguments.
+        @param callback (method) The callback to execute with the return value of the function. If the function raised
+                                 an exception, the callback receives the exception instance instead.
+        @param client   (Client) The client the callback acts upon, which has its events updated after the callback has
+                                 been executed. When this is None and the callback is a method of a client, that client
+                                 is used.
+        """
+
+        if not self._thread_pool:
+            self._thread_pool = ThreadPool(self, self._thread_count, self._thread_queue)
+
+        self._thread_pool.defer(func, args, callback, client)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def handle_channel_message (self, channel, message):
+        """
+        This callback will be executed when a message channel has received a notice.
+
+        @param channel (MessageChannelClient) The channel.
+        @param message (object)               The message.
+        """
+
+        pass
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def handle_channel_request (self, channel, message):
+        """
+        This callback will be executed when a message channel has received a request.
+
+        @param channel (MessageChannelClient) The channel.
+        @param message (object)               The message.
+
+        @return (object) The response.
+        """
+
+        raise ChannelException("Server.handle_channel_request() must be overridden")
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def handle_channels (self, pid, sockets, rings=None):
         """
         This callback will be executed when channels need to be prepared for a worker process.
 
         @param pid     (int)  The process id.
         @param sockets (list) A list of channel sockets for process communication.
+        @param rings   (list) A list of two-part tuples containing the inbound and outbound RingBuffer instances of each
+                              channel, when channel rings are enabled.
         """
 
         channels = []
 
         for i in xrange(0, self._channel_count):
-            channels.append(ChannelClient(sockets[i], pid, self))
+            if rings:
+                channels.append(RingChannelClient(sockets[i], pid, self, self._channel_codec, rings[i]))
+
+            elif self._channel_codec:
+                channels.append(MessageChannelClient(sockets[i], pid, self, self._channel_codec))
+
+            else:
+                channels.append(ChannelClient(sockets[i], pid, self))
 
         return channels
 
@@ -268,6 +554,9 @@ class Server:
         @return (bool) True, if processing should continue, otherwise False.
         """
 
+        if self._stats_slot:
+            self._stats_slot.errors += 1
+
         if isinstance(exception, ServerException):
             print "Important server message: %s" % exception
 
@@ -298,7 +587,10 @@ class Server:
 
     def handle_loop (self):
         """
-        This callback will be executed at the top of each event manager loop.
+        This callback will be executed every [loop interval] seconds.
+
+        Note: The loop timer is only scheduled when this method has been overridden, so idle processes can sleep until
+              the next event or timer.
 
         @return (list) A list of modified clients (or an empty list).
         """
@@ -350,20 +642,43 @@ class Server:
 
     # ------------------------------------------------------------------------------------------------------------------
 
+    def handle_slow_callback (self, client, callback, elapsed, stack):
+        """
+        This callback will be executed when a client or timer callback has run beyond the slow callback threshold.
+
+        @param client   (Client) The client to which the callback belongs, or None if the callback is a timer.
+        @param callback (str)    The callback name.
+        @param elapsed  (float)  The number of seconds the callback ran.
+        @param stack    (list)   The stack at which the callback was running once it passed the threshold, as a list of
+                                 formatted lines, or None if the callback finished before it could be captured.
+        """
+
+        if client:
+            name = "%s.%s()" % (client.__class__.__name__, callback)
+
+        else:
+            name = "timer %s()" % callback
+
+        print "Slow callback in process %d: %s ran for %.3f ms" % (os.getpid(), name, elapsed * 1000)
+
+        if stack:
+            print "".join(stack).rstrip()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
     def handle_timeout_check (self):
         """
-        Loop through all active clients and find any that may be idle or have timed out.
+        Find the clients that have been idle for too long and execute their timeout callback.
+
+        @return (list) A list of timed out clients that are still going to be processed.
         """
 
-        clients      = []
-        now          = time()
-        minimum_time = now - self._timeout
+        clients = []
+        now     = time()
 
-        # iterate all clients and find the ones that are timed out/idle
+        # the timing wheel only hands back clients that have actually timed out
         # execute the timeout callback and determine what to do
-        for client in filter(lambda x: x._last_access_time < minimum_time and not x._is_channel and not x._is_host,
-                             self._clients.values()):
-
+        for client in self._timeout_wheel.expire(now):
             if not client.handle_timeout(self._timeout):
                 # handle timeout callback cleared events--so, we'll forcefully unregister the client
                 self.unregister_client(client)
@@ -373,6 +688,8 @@ class Server:
             # update the client time
             client._last_access_time = now
 
+            self._timeout_wheel.add(client, now)
+
             # client is good and they're being appended to a list that will all have their fileno's updated in the
             # event manager with their new events
             clients.append(client)
@@ -398,6 +715,12 @@ class Server:
 
             del self._channels[pid]
 
+        if pid in self._handoffs:
+            self.unregister_client(self._handoffs[pid])
+
+        if pid in self._stats_slots:
+            del self._stats_slots[pid]
+
         if not self._is_shutting_down:
             self.spawn_worker()
 
@@ -436,6 +759,45 @@ class Server:
 
     # ------------------------------------------------------------------------------------------------------------------
 
+    def profile (self, status):
+        """
+        Start or stop the sampling profiler of this process, and of all worker processes if this is the parent. When a
+        profiler is stopped, it writes its samples to the profile path.
+
+        @param status (bool) The profiling status.
+        """
+
+        if not self._profile_path:
+            raise ServerException("Cannot profile, because no profile path has been set")
+
+        if status == self._is_profiling:
+            return
+
+        self._is_profiling = status
+
+        if self._is_parent:
+            # each worker process toggles its own profiler
+            for pid in self._workers:
+                try:
+                    os.kill(pid, signal.SIGUSR2)
+
+                except OSError:
+                    pass
+
+        if status:
+            self._profiler = SamplingProfiler(self._profile_interval)
+
+            self._profiler.start()
+
+            return
+
+        self._profiler.stop()
+        self._profiler.write(self._profile_path.replace("%d", str(os.getpid())))
+
+        self._profiler = None
+
+    # ------------------------------------------------------------------------------------------------------------------
+
     def register_client (self, client):
         """
         Register a client.
@@ -445,6 +807,18 @@ class Server:
 
         self._clients[client._fileno] = client
 
+        if not client._is_channel and not client._is_host:
+            self._active_count += 1
+
+            if self._stats_slot:
+                self._stats_slot.connections += 1
+
+            if self._handoff:
+                self.__schedule_report()
+
+        if self._timeout_wheel and not client._is_channel and not client._is_host:
+            self._timeout_wheel.add(client, client._last_access_time)
+
         if not client._is_blocking:
             self._event_manager.register(client._fileno, client._events)
 
@@ -456,6 +830,26 @@ class Server:
 
     # ------------------------------------------------------------------------------------------------------------------
 
+    def request_channel (self, message, callback, channel_index=0, pid=0):
+        """
+        Send a request over a message channel.
+
+        @param message       (object) The message.
+        @param callback      (method) The callback to execute with the response once it has been received.
+        @param channel_index (int)    The channel index.
+        @param pid           (int)    The process id.
+        """
+
+        try:
+            channel = self._channels[pid][channel_index]
+
+        except (IndexError, KeyError):
+            raise ChannelException("Invalid pid or channel index")
+
+        channel.request(message, callback)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
     def restart (self):
         """
         Send a restart request to all worker processes.
@@ -468,6 +862,41 @@ class Server:
 
     # ------------------------------------------------------------------------------------------------------------------
 
+    def resolve (self, host, callback):
+        """
+        Resolve a hostname to an ip address on a thread pool thread, and keep the address for the resolve ttl.
+
+        @param host     (str)    The hostname.
+        @param callback (method) The callback to execute with the ip address. If the lookup failed, the callback
+                                 receives the exception instance instead.
+        """
+
+        if not self._resolver:
+            self._resolver = Resolver(self, self._resolve_ttl)
+
+        self._resolver.resolve(host, callback)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def send_channel (self, message, channel_index=0, pid=0):
+        """
+        Send a notice over a message channel.
+
+        @param message       (object) The message.
+        @param channel_index (int)    The channel index.
+        @param pid           (int)    The process id.
+        """
+
+        try:
+            channel = self._channels[pid][channel_index]
+
+        except (IndexError, KeyError):
+            raise ChannelException("Invalid pid or channel index")
+
+        channel.send(message)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
     def shutdown (self):
         """
         Unregister all clients and kill worker processes.
@@ -483,10 +912,21 @@ class Server:
         # remove the sigchld handler
         #signal.signal(signal.SIGCHLD, signal.SIG_IGN)
 
+        if self._is_profiling:
+            # keep the samples collected so far
+            self.profile(False)
+
+        if self._process_pool:
+            # the compute processes are not replaced while their channels are being unregistered
+            self._process_pool.close()
+
         # unregister and shutdown all clients
         for client in self._clients.values():
             self.unregister_client(client)
 
+        if self._thread_pool:
+            self._thread_pool.close()
+
         if not self._is_parent:
             return
 
@@ -515,7 +955,9 @@ class Server:
             raise ServerException("Cannot spawn worker, because this platform does not support forking")
 
         # create a socketpair for each channel
+        parent_rings   = []
         parent_sockets = []
+        worker_rings   = []
         worker_sockets = []
 
         for i in xrange(0, self._channel_count):
@@ -528,21 +970,104 @@ class Server:
             parent_sockets.append(pair[0])
             worker_sockets.append(pair[1])
 
+            if self._ring_size:
+                # the rings are shared memory, so they must exist before the fork
+                rings = (RingBuffer(self._ring_size), RingBuffer(self._ring_size))
+
+                parent_rings.append(rings)
+                worker_rings.append((rings[1], rings[0]))
+
+        if self._acceptor:
+            # connections are passed over a socketpair of their own, so they never mix with channel data
+            handoff_sockets = socket.socketpair()
+
+            handoff_sockets[0].setblocking(0)
+            handoff_sockets[1].setblocking(0)
+
+        if self._stats:
+            # reuse the slot of an exited worker process
+            stats_slot = 1
+
+            while stats_slot in self._stats_slots.values():
+                stats_slot += 1
+
         pid = os.fork()
 
         if pid:
             # initialize and register worker channels
             self._workers.append(pid)
-            self.__register_channels(self.handle_channels(pid, parent_sockets))
+
+            if self._stats:
+                self._stats_slots[pid] = stats_slot
+
+            if self._ring_size:
+                self.__register_channels(self.handle_channels(pid, parent_sockets, parent_rings))
+
+            else:
+                self.__register_channels(self.handle_channels(pid, parent_sockets))
+
+            if self._acceptor:
+                handoff_sockets[1].close()
+
+                self._handoffs[pid] = HandoffChannelClient(handoff_sockets[0], pid, self)
+
+                self.register_client(self._handoffs[pid])
+
+                if self._is_accept_paused and self._is_listening:
+                    # the new worker process is idle, so the parent process resumes accepting connections
+                    self._is_accept_paused = False
+
+                    for host in self._hosts:
+                        self._event_manager.register(host._fileno, host._events)
 
             return
 
         # initialization from worker perspective
         try:
+            self._active_count = 0
             self._channels     = {}
             self._clients      = {}
             self._is_listening = False
             self._is_parent    = False
+            self._timers       = []
+
+            if self._timeout:
+                self._timeout_wheel = TimingWheel(self._timeout, self._timeout_interval)
+
+            # each worker reads into its own scratch buffers
+            client.READ_BUFFER_POOL = BufferPool()
+
+            if self._instrument:
+                # each worker records its own histograms
+                self._instrument = Instrumentation()
+
+            if self._watchdog:
+                # the watchdog thread of the parent process does not survive the fork
+                self._watchdog = Watchdog(self._slow_callback)
+
+            if self._thread_pool:
+                # the threads of the parent process do not survive the fork
+                self._thread_pool.close()
+
+                self._thread_pool = None
+
+            if self._resolver:
+                # the lookups of the parent process finish in the parent process
+                self._resolver = None
+
+            if self._is_profiling:
+                # interval timers are not inherited, so a worker spawned while profiling starts a profiler of its own
+                self._is_profiling = False
+                self._profiler     = None
+
+                self.profile(True)
+
+            if self._stats:
+                # each worker counts in its own slot
+                self._stats_slot  = self._stats.get_slot(stats_slot)
+                self._stats_slots = {}
+
+                client.STATS = self._stats_slot
 
             # initialize the event manager
             self._event_manager            = self._event_manager.__class__(self)
@@ -552,7 +1077,32 @@ class Server:
             self._event_manager_unregister = self._event_manager.unregister
 
             # initialize and register parent channels
-            self.__register_channels(self.handle_channels(os.getpid(), worker_sockets))
+            if self._ring_size:
+                self.__register_channels(self.handle_channels(os.getpid(), worker_sockets, worker_rings))
+
+            else:
+                self.__register_channels(self.handle_channels(os.getpid(), worker_sockets))
+
+            if self._reuseport:
+                # replace the inherited host sockets with listening sockets that belong to this worker alone
+                self.__reuseport_hosts()
+
+            if self._acceptor:
+                # connections arrive from the parent process, so the inherited host sockets and the handoff channels
+                # of the other worker processes are of no use
+                handoff_sockets[0].close()
+
+                for host in self._hosts:
+                    host._client_socket.close()
+
+                for handoff in self._handoffs.values():
+                    handoff._client_socket.close()
+
+                self._handoffs = {}
+                self._hosts    = []
+                self._handoff  = HandoffChannelClient(handoff_sockets[1], os.getpid(), self)
+
+                self.register_client(self._handoff)
 
             # start listening on all hosts and then start the server
             self.listen(True)
@@ -586,6 +1136,13 @@ class Server:
                 print "| Event manager:       %-40s |" % self._event_manager.__class__.__name__
                 print "| Workers:             %-40d |" % self._worker_count
                 print "| Channels per worker: %-40d |" % self._channel_count
+                print "| Compute processes:   %-40d |" % self._process_count
+                print "| Reuse port:          %-40s |" % self._reuseport
+                print "| Parent acceptor:     %-40s |" % self._acceptor
+                print "| Statistics:          %-40s |" % (self._stats is not None)
+                print "| Instrumentation:     %-40s |" % (self._instrument is not None)
+                print "| Slow callbacks:      %-40s |" % (("%g seconds" % self._slow_callback) if self._watchdog else "-")
+                print "| Profile path:        %-40s |" % (self._profile_path if self._profile_path else "-")
                 print "| User:                %-40s |" % (self._user if self._user else "-")
                 print "| Group:               %-40s |" % (self._group if self._group else "-")
                 print "| User mask:           %-40s |" % (self._umask if self._umask else "-")
@@ -609,8 +1166,8 @@ class Server:
                 self.spawn_worker()
 
             # if there are no workers, we need to force the process to listen on all hosts, otherwise no external clients
-            # will be accepted
-            if self._worker_count == 0:
+            # will be accepted, and the same goes for the parent process when it's the acceptor
+            if self._worker_count == 0 or self._acceptor:
                 self.listen(True)
 
         EVENT_ERROR = self._event_manager.EVENT_ERROR
@@ -620,89 +1177,90 @@ class Server:
         # we cache some methods/vars locally to avoid dereferencing in each loop which could potentially be
         # thousands of times per second
         clients                = self._clients
-        is_graceful_shutdown   = self._is_graceful_shutdown
-        is_shutting_down       = self._is_shutting_down
-        loop_check             = 0
+        eager_writes           = self._eager_writes
+        execute_timed_func     = self.__execute_timed
+        instrument             = self._instrument
+        is_timed               = self._instrument is not None or self._watchdog is not None
         modify_func            = self._event_manager_modify
         poll_func              = self._event_manager_poll
-        shutdown_check         = 0
-        timeout_check          = 0
+        run_timers_func        = self.__run_timers
+        stats                  = self._stats_slot
+        timeout_add_func       = self._timeout_wheel.add if self._timeout_wheel else None
         unregister_func        = self._event_manager_unregister
         unregister_client_func = self.unregister_client
 
-        if not self._is_parent or self._worker_count == 0:
-            # post start initialization
-            self.handle_init()
+        # schedule the periodic callbacks
+        self.call_later(1, self.__handle_shutdown_timer)
 
-        # loop until the server is going to shutdown
-        while not is_shutting_down or is_graceful_shutdown:
-            now = time()
+        if self._timeout:
+            self.call_later(self._timeout_interval, self.__handle_timeout_timer)
 
-            try:
-                if now - 1 > shutdown_check:
-                    # check shutdown status and for exiting worker processes
-                    is_graceful_shutdown = self._is_graceful_shutdown
-                    is_shutting_down     = self._is_shutting_down
-                    shutdown_check       = now
+        if self._stats:
+            self.call_later(1, self.__handle_stats_timer)
 
-                    if is_shutting_down:
-                        if self._is_listening:
-                            self.listen(False)
+        if self._loop_interval is not None and self.handle_loop.im_func is not Server.handle_loop.im_func:
+            self.call_later(self._loop_interval, self.__handle_loop_timer)
 
-                        if self._is_parent and len(self._workers) > 0:
-                            # we cannot exit if we're the parent and there are child processes still running
-                            pass
+        if instrument:
+            poll_histogram   = instrument.get("poll")
+            timers_histogram = instrument.get("timers")
 
-                        elif len(filter(lambda x: not x._is_host and not x._is_channel, self._clients.values())) == 0:
-                            # we have no regular clients connected so we can shutdown
-                            break
+        if self._watchdog:
+            self._watchdog.start()
 
-                    while self._is_parent and len(self._workers) > 0:
-                        # check for exiting child processes
-                        pid, status = os.waitpid(0, os.WNOHANG)
+        if not self._is_parent or self._worker_count == 0:
+            if self._process_count:
+                # the compute processes are forked before any client has connected to this process
+                self._process_pool = ProcessPool(self, self._process_count, self._process_queue)
 
-                        if not pid:
-                            break
+            # post start initialization
+            self.handle_init()
 
-                        try:
-                            self.handle_worker_exited(pid, status)
+        now = time()
 
-                        except Exception, e:
-                            # an unhandled exception has been caught
-                            self.handle_exception(e)
+        # loop until the server is going to shutdown
+        while True:
+            try:
+                # execute expired timers (the shutdown timer decides when a graceful shutdown has finished)
+                if instrument:
+                    started = time()
+                    timeout = run_timers_func()
 
-                    # execute a timeout callback at most every [timeout interval] seconds
-                    if self._timeout and now - self._timeout_interval > timeout_check:
-                        try:
-                            timeout_check = now
+                    timers_histogram.record(time() - started)
 
-                            # update the events for any clients that have timed out and are still going to be processed
-                            for client in self.handle_timeout_check():
-                                modify_func(client._fileno, client._events)
+                else:
+                    timeout = run_timers_func()
 
-                        except Exception, e:
-                            # an unhandled exception has been caught
-                            self.handle_exception(e)
+                if self._is_stopped or (self._is_shutting_down and not self._is_graceful_shutdown):
+                    break
 
-                            continue
+                # wait for events until the next timer deadline
+                if instrument or stats:
+                    polled = time()
 
-                    # execute a loop callback at most once per second
-                    if now - self._loop_interval > loop_check:
-                        try:
-                            loop_check = now
+                    if stats:
+                        # everything done since the previous poll returned has delayed the events that arrived meanwhile
+                        lag                    = polled - now
+                        stats.handler_seconds += lag
 
-                            # update the events for any clients that were changed during the loop handler
-                            for client in self.handle_loop():
-                                modify_func(client._fileno, client._events)
+                        if lag > stats.lag:
+                            stats.lag = lag
 
-                        except Exception, e:
-                            # an unhandled exception has been caught
-                            self.handle_exception(e)
+                events_list = poll_func(timeout)
+                now         = time()
 
-                            continue
+                if instrument:
+                    poll_histogram.record(now - polled)
+
+                if stats:
+                    stats.poll_events  += len(events_list)
+                    stats.poll_seconds += now - polled
+                    stats.polls        += 1
 
                 # iterate over all clients that have an active event
-                for fileno, events in poll_func():
+                # note: each client is handled within its own try block, because edge-triggered event managers will not
+                #       report the remaining events again if we bail out of this loop early
+                for fileno, events in events_list:
                     try:
                         client = clients[fileno]
 
@@ -715,19 +1273,48 @@ class Server:
                     # copy the events so we know if they have changed after we handle the event
                     client_events = client._events
 
-                    # handle the event
-                    if events & EVENT_ERROR:
-                        client.handle_error()
+                    try:
+                        # handle the event
+                        if events & EVENT_ERROR:
+                            if is_timed:
+                                execute_timed_func(client.handle_error, (), client, "handle_error")
 
-                        unregister_client_func(client)
+                            else:
+                                client.handle_error()
 
-                        continue
+                            unregister_client_func(client)
+
+                            continue
 
-                    if events & EVENT_READ:
-                        client.handle_read()
+                        if events & EVENT_READ:
+                            if is_timed:
+                                execute_timed_func(client.handle_read, (), client, "handle_read")
+
+                            else:
+                                client.handle_read()
+
+                        if events & EVENT_WRITE or (eager_writes and client._events & ~client_events & EVENT_WRITE):
+                            # when the handler has just written data, try to write it right away, because it usually
+                            # fits in the socket buffer and then write events never need to be modified on
+                            if is_timed:
+                                execute_timed_func(client.handle_write, (), client, "handle_write")
+
+                            else:
+                                client.handle_write()
+
+                    except socket.error, e:
+                        if e[0] not in (errno.EWOULDBLOCK, errno.EAGAIN):
+                            # an unrecoverable socket error has occurred
+                            unregister_client_func(client)
+
+                            continue
 
-                    if events & EVENT_WRITE:
-                        client.handle_write()
+                    except (IOError, OSError):
+                        pass
+
+                    except Exception, e:
+                        # an unhandled exception has been caught
+                        self.handle_exception(e, client)
 
                     # check for event changes
                     if client_events != client._events:
@@ -743,31 +1330,16 @@ class Server:
                     # update the client time
                     client._last_access_time = now
 
-            except socket.error, e:
-                if e[0] not in (errno.EWOULDBLOCK, errno.EAGAIN):
-                    # an unrecoverable socket error has occurred
-                    unregister_client_func(client)
+                    if client._timeout_tick is not None:
+                        # move the client to its new slot in the timing wheel
+                        timeout_add_func(client, now)
 
             except (select.error, IOError, OSError):
                 pass
 
             except Exception, e:
                 # an unhandled exception has been caught
-                self.handle_exception(e, client)
-
-                # check for event changes
-                if client_events != client._events:
-                    if client._events == 0:
-                        # no more events for this client
-                        unregister_client_func(client)
-
-                        continue
-
-                    # update the events
-                    modify_func(fileno, client._events)
-
-                # update the client time
-                client._last_access_time = now
+                self.handle_exception(e)
 
         self.shutdown()
 
@@ -787,6 +1359,19 @@ class Server:
             except:
                 pass
 
+            if self._handoffs.get(client._pid) is client:
+                del self._handoffs[client._pid]
+
+            elif self._handoff is client:
+                self._handoff = None
+
+        else:
+            if not client._is_host:
+                self._active_count -= 1
+
+                if self._handoff:
+                    self.__schedule_report()
+
         if self._is_long_running and not client._is_channel and not client._is_host:
             # we're serving long-running requests so we must reregister the host filenos that we removed when the
             # current client connected
@@ -804,6 +1389,9 @@ class Server:
             # some event managers auto-remove a descriptor when it is closed, which may cause an exception to be thrown
             pass
 
+        if self._timeout_wheel:
+            self._timeout_wheel.remove(client)
+
         del self._clients[client._fileno]
 
         client.handle_shutdown()
@@ -857,6 +1445,250 @@ class Server:
 
     # ------------------------------------------------------------------------------------------------------------------
 
+    def __create_host_socket (self, ip, port, listen=True):
+        """
+        Create a non-blocking host socket.
+
+        @param ip     (str)  A hostname or ip address.
+        @param port   (int)  The port.
+        @param listen (bool) Indicates that the socket should start listening once it has been bound.
+
+        @return (socket) The host socket.
+        """
+
+        try:
+            host = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+
+            # disable blocking
+            host.setblocking(0)
+
+            host.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+            if self._reuseport:
+                host.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+            host.bind((ip, port))
+
+            if listen:
+                host.listen(socket.SOMAXCONN)
+
+            return host
+
+        except socket.error, e:
+            raise HostException("Cannot add host on ip '%s' port '%d': %s" % (ip, port, e[1]))
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __execute_timed (self, callback, args, client, name):
+        """
+        Execute a callback, recording its duration and reporting it if it's slow.
+
+        @param callback (method) The callback.
+        @param args     (tuple)  The callback arguments.
+        @param client   (Client) The client to which the callback belongs, or None if the callback is a timer.
+        @param name     (str)    The callback name.
+        """
+
+        watchdog = self._watchdog
+        started  = time()
+
+        if watchdog:
+            watchdog.watch(started)
+
+        try:
+            callback(*args)
+
+        finally:
+            elapsed = time() - started
+
+            if self._instrument:
+                if client:
+                    self._instrument.get_client(client.__class__)[name].record(elapsed)
+
+                else:
+                    self._instrument.get("timer " + name).record(elapsed)
+
+            if watchdog:
+                stack = watchdog.release()
+
+                if elapsed >= self._slow_callback:
+                    if self._stats_slot:
+                        self._stats_slot.slow_callbacks += 1
+
+                    try:
+                        self.handle_slow_callback(client, name, elapsed, stack)
+
+                    except Exception, e:
+                        # an unhandled exception has been caught
+                        self.handle_exception(e)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __hand_off (self, client_socket, client_address, server_address):
+        """
+        Pass a connection to the least-loaded worker process.
+
+        @param client_socket  (socket) The client socket.
+        @param client_address (tuple)  The client ip address and port.
+        @param server_address (tuple)  The server ip address and port upon which the client connected.
+        """
+
+        handoffs = sorted(self._handoffs.values(), key=HandoffChannelClient.get_load)
+
+        if self._is_long_running:
+            # long-running worker processes only handle one client at a time
+            handoffs = [handoff for handoff in handoffs if handoff.get_load() == 0]
+
+        try:
+            for handoff in handoffs:
+                if handoff.hand_off(client_socket):
+                    return
+
+            # every worker process is busy or has fallen too far behind, so the connection is dropped
+
+        finally:
+            # the worker process has its own copy of the connection
+            client_socket.close()
+
+            if self._is_long_running and not [handoff for handoff in handoffs if handoff.get_load() == 0]:
+                # every worker process is busy, so connections wait in the backlog until a worker process reports that
+                # it's idle
+                self._is_accept_paused = True
+
+                for host in self._hosts:
+                    self._event_manager.unregister(host._fileno)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __handle_instrument_signal (self, code, frame):
+        """
+        Print the instrumentation histograms of this process, and of all worker processes if this is the parent.
+
+        @param code  (int)    The signal code.
+        @param frame (object) The stack frame.
+        """
+
+        if self._is_parent:
+            for pid in self._workers:
+                try:
+                    os.kill(pid, signal.SIGUSR1)
+
+                except OSError:
+                    pass
+
+        print "Instrumentation of process %d:" % os.getpid()
+        print self._instrument.dump()
+
+        sys.stdout.flush()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __handle_loop_timer (self):
+        """
+        Execute the loop callback and schedule the next execution.
+        """
+
+        self.call_later(self._loop_interval, self.__handle_loop_timer)
+
+        # update the events for any clients that were changed during the loop handler
+        for client in self.handle_loop():
+            self._event_manager_modify(client._fileno, client._events)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __handle_profile_signal (self, code, frame):
+        """
+        Toggle the sampling profiler.
+
+        @param code  (int)    The signal code.
+        @param frame (object) The stack frame.
+        """
+
+        try:
+            self.profile(not self._is_profiling)
+
+        except Exception, e:
+            # an unhandled exception has been caught
+            self.handle_exception(e)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __handle_shutdown_timer (self):
+        """
+        Check the shutdown status and for exiting worker processes, and schedule the next check.
+        """
+
+        self.call_later(1, self.__handle_shutdown_timer)
+
+        if self._is_shutting_down:
+            if self._is_listening:
+                self.listen(False)
+
+            if self._is_parent and len(self._workers) > 0:
+                # we cannot exit if we're the parent and there are child processes still running
+                pass
+
+            elif len(filter(lambda x: not x._is_host and not x._is_channel, self._clients.values())) == 0:
+                # we have no regular clients connected so we can shutdown
+                self._is_stopped = True
+
+                return
+
+        while self._is_parent and len(self._workers) > 0:
+            # check for exiting child processes
+            pid, status = os.waitpid(0, os.WNOHANG)
+
+            if not pid:
+                break
+
+            try:
+                self.handle_worker_exited(pid, status)
+
+            except Exception, e:
+                # an unhandled exception has been caught
+                self.handle_exception(e)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __handle_stats_timer (self):
+        """
+        Publish the counters of this process and schedule the next publication.
+        """
+
+        self.call_later(1, self.__handle_stats_timer)
+
+        self._stats_slot.active = self._active_count
+
+        if self._instrument:
+            self._stats_slot.histograms = self._instrument.to_dict()
+
+        if self._process_pool:
+            self._stats_slot.process_pending = self._process_pool._pending_count
+            self._stats_slot.process_queue   = len(self._process_pool._queue)
+
+        if self._thread_pool:
+            self._stats_slot.thread_pending = self._thread_pool._pending_count
+            self._stats_slot.thread_queue   = self._thread_pool._queue.qsize()
+
+        self._stats_slot.publish()
+
+        self._stats_slot.lag = 0.0
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __handle_timeout_timer (self):
+        """
+        Execute the timeout check and schedule the next execution.
+        """
+
+        self.call_later(self._timeout_interval, self.__handle_timeout_timer)
+
+        # update the events for any clients that have timed out and are still going to be processed
+        for client in self.handle_timeout_check():
+            self._event_manager_modify(client._fileno, client._events)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
     def __register_channels (self, channels):
         """
         Register worker channels.
@@ -888,3 +1720,95 @@ class Server:
 
             else:
                 self._channels[channel._pid] = [channel]
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __report_load (self):
+        """
+        Report the count of regular clients to the parent process.
+        """
+
+        self._is_reporting = False
+
+        if not self._handoff:
+            return
+
+        handoff = self._handoff
+        events  = handoff._events
+
+        handoff.report(self._active_count)
+
+        # timers are executed outside of the event loop, so the report is written right away
+        handoff.handle_write()
+
+        if handoff._events != events:
+            self._event_manager_modify(handoff._fileno, handoff._events)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __reuseport_hosts (self):
+        """
+        Replace the host sockets inherited from the parent process with listening sockets owned by this worker process.
+        """
+
+        hosts = []
+
+        for host in self._hosts:
+            try:
+                host._client_socket.close()
+
+            except:
+                pass
+
+            hosts.append(HostClient(self.__create_host_socket(*host._client_address), host._client_address, self))
+
+        self._hosts = hosts
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __run_timers (self):
+        """
+        Execute all timers that have reached their deadline.
+
+        @return (float) The number of seconds until the next timer deadline, or None if there are no pending timers.
+        """
+
+        is_timed = self._instrument is not None or self._watchdog is not None
+        timers   = self._timers
+        now      = time()
+
+        while timers and timers[0][0] <= now:
+            timer = heapq.heappop(timers)[2]
+
+            if timer._is_cancelled:
+                continue
+
+            try:
+                if is_timed:
+                    self.__execute_timed(timer._callback, timer._args, None,
+                                         getattr(timer._callback, "__name__", "callback").lstrip("_"))
+
+                else:
+                    timer._callback(*timer._args)
+
+            except Exception, e:
+                # an unhandled exception has been caught
+                self.handle_exception(e)
+
+        # cancelled timers are left in the heap, so they may cause an early wake up but never a late one
+        if not timers:
+            return None
+
+        return max(0, timers[0][0] - time())
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __schedule_report (self):
+        """
+        Schedule a load report, so all client changes made during one event loop iteration share a single report.
+        """
+
+        if not self._is_reporting:
+            self._is_reporting = True
+
+            self.call_later(0, self.__report_load)
@@ -0,0 +1,208 @@
+# This file is part of Elements.
+# Copyright (c) 2010 Sean Kerr. All rights reserved.
+#
+# The full license is available in the LICENSE file that was distributed with this source code.
+#
+# Author: Sean Kerr <sean@code-box.org>
+
+import marshal
+import mmap
+import os
+import struct
+
+from time import time
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+STATS_FIELDS = (("pid",             "Q"), # process id, or 0 when the slot is unused
+                ("started",         "d"), # time at which the process started counting
+                ("connections",     "Q"), # count of accepted connections
+                ("active",          "Q"), # count of connections that are currently open
+                ("requests",        "Q"), # count of handled requests
+                ("bytes_read",      "Q"), # count of bytes read from clients
+                ("bytes_written",   "Q"), # count of bytes written to clients
+                ("errors",          "Q"), # count of unhandled exceptions
+                ("polls",           "Q"), # count of event loop iterations
+                ("poll_events",     "Q"), # count of events returned by all polls
+                ("poll_seconds",    "d"), # seconds spent waiting in poll
+                ("handler_seconds", "d"), # seconds spent between polls, handling events and executing timers
+                ("lag",             "d"), # longest time between two polls since the previous publication
+                ("slow_callbacks",  "Q"), # count of callbacks that ran beyond the slow callback threshold
+                ("process_pending", "Q"), # count of functions deferred to compute processes whose callback hasn't run
+                ("process_queue",   "Q"), # count of functions waiting for a compute process
+                ("thread_pending",  "Q"), # count of functions deferred to the thread pool whose callback hasn't run
+                ("thread_queue",    "Q")) # count of functions waiting for a thread pool thread
+
+STATS_HISTOGRAMS = struct.Struct("QI") # sequence and length of the published histograms
+STATS_NAMES      = tuple([name for name, format in STATS_FIELDS])
+STATS_SLOT       = struct.Struct("".join([format for name, format in STATS_FIELDS]))
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class StatsBlock:
+
+    def __init__ (self, slot_count, histogram_size=0):
+        """
+        Create a new StatsBlock instance.
+
+        A stats block is a fixed-layout block of counters in shared memory, with one slot per process. It must be created
+        before the process forks. Each process only ever writes to its own slot, so no locking is needed, and any
+        process can read all slots.
+
+        @param slot_count     (int) The slot count.
+        @param histogram_size (int) The maximum size of the marshalled histograms each slot can publish, or 0 if slots
+                                    only publish counters.
+        """
+
+        slot_size = STATS_SLOT.size
+
+        if histogram_size:
+            slot_size += STATS_HISTOGRAMS.size + histogram_size
+
+        self._histogram_size = histogram_size                         # maximum size of the published histograms
+        self._map            = mmap.mmap(-1, slot_size * slot_count) # shared memory, inherited by forked processes
+        self._slot_count     = slot_count                             # count of slots
+        self._slot_size      = slot_size                              # size of a slot
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def get_slot (self, index):
+        """
+        Retrieve a slot for the current process, and reset its counters.
+
+        @param index (int) The slot index.
+
+        @return (StatsSlot) The StatsSlot instance.
+        """
+
+        slot = StatsSlot(self._map, index * self._slot_size, self._histogram_size)
+
+        slot.publish()
+
+        return slot
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def read (self):
+        """
+        Read the counters of all processes.
+
+        @return (list) A list of dicts, one for each slot in use, containing the slot index and all counters, and the
+                       published histograms if the block has room for them.
+        """
+
+        stats = []
+
+        for index in xrange(0, self._slot_count):
+            offset = index * self._slot_size
+            values = STATS_SLOT.unpack_from(self._map, offset)
+
+            if not values[0]:
+                continue
+
+            slot         = dict(zip(STATS_NAMES, values))
+            slot["slot"] = index
+
+            if self._histogram_size:
+                slot["histograms"] = self.__read_histograms(offset + STATS_SLOT.size)
+
+            stats.append(slot)
+
+        return stats
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __read_histograms (self, offset):
+        """
+        Read the histograms published by a slot.
+
+        @param offset (int) The offset of the histogram area of the slot.
+
+        @return (dict) The histograms by name.
+        """
+
+        map = self._map
+
+        # the sequence is odd while the process is publishing, and changes with each publication, so a read that
+        # overlaps a publication is retried
+        for attempt in xrange(0, 10):
+            sequence, length = STATS_HISTOGRAMS.unpack_from(map, offset)
+
+            if sequence & 1:
+                continue
+
+            start = offset + STATS_HISTOGRAMS.size
+            data  = map[start:start + length]
+
+            if STATS_HISTOGRAMS.unpack_from(map, offset)[0] == sequence:
+                return marshal.loads(data) if length else {}
+
+        return {}
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class StatsSlot:
+
+    def __init__ (self, map, offset, histogram_size=0):
+        """
+        Create a new StatsSlot instance.
+
+        Counters are plain attributes, so counting is as cheap as an attribute increment. They are copied into shared
+        memory each time the slot is published.
+
+        @param map            (mmap) The shared memory.
+        @param offset         (int)  The offset of the slot within the shared memory.
+        @param histogram_size (int)  The maximum size of the marshalled histograms.
+        """
+
+        self._histogram_size = histogram_size # maximum size of the published histograms
+        self._map            = map            # shared memory
+        self._offset         = offset         # offset of the slot
+        self._sequence       = 0              # sequence of the published histograms
+        self.active          = 0              # count of connections that are currently open
+        self.bytes_read      = 0              # count of bytes read from clients
+        self.bytes_written   = 0              # count of bytes written to clients
+        self.connections     = 0              # count of accepted connections
+        self.errors          = 0              # count of unhandled exceptions
+        self.handler_seconds = 0.0            # seconds spent between polls
+        self.histograms      = None           # histograms to publish, as dicts of plain values by name
+        self.lag             = 0.0            # longest time between two polls since the previous publication
+        self.pid             = os.getpid()    # process id
+        self.poll_events     = 0              # count of events returned by all polls
+        self.poll_seconds    = 0.0            # seconds spent waiting in poll
+        self.polls           = 0              # count of event loop iterations
+        self.process_pending = 0              # count of functions deferred to processes whose callback hasn't run
+        self.process_queue   = 0              # count of functions waiting for a compute process
+        self.requests        = 0              # count of handled requests
+        self.slow_callbacks  = 0              # count of slow callbacks
+        self.started         = time()         # time at which counting started
+        self.thread_pending  = 0              # count of deferred functions whose callback hasn't run
+        self.thread_queue    = 0              # count of functions waiting for a thread
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def publish (self):
+        """
+        Copy the counters into shared memory.
+        """
+
+        STATS_SLOT.pack_into(self._map, self._offset, *[getattr(self, name) for name in STATS_NAMES])
+
+        if not self._histogram_size:
+            return
+
+        data   = marshal.dumps(self.histograms or {})
+        offset = self._offset + STATS_SLOT.size
+        start  = offset + STATS_HISTOGRAMS.size
+
+        if len(data) > self._histogram_size:
+            # there are too many histograms to fit, so none are published
+            data = ""
+
+        STATS_HISTOGRAMS.pack_into(self._map, offset, self._sequence + 1, 0)
+
+        self._map[start:start + len(data)] = data
+
+        self._sequence += 2
+
+        STATS_HISTOGRAMS.pack_into(self._map, offset, self._sequence, len(data))
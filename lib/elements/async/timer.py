@@ -0,0 +1,157 @@
+# This file is part of Elements.
+# Copyright (c) 2010 Sean Kerr. All rights reserved.
+#
+# The full license is available in the LICENSE file that was distributed with this source code.
+#
+# Author: Sean Kerr <sean@code-box.org>
+
+import math
+import time
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class Timer:
+
+    def __init__ (self, deadline, callback, args):
+        """
+        Create a new Timer instance.
+
+        @param deadline (float)  The time at which the callback will be executed.
+        @param callback (method) The callback.
+        @param args     (tuple)  The callback arguments.
+        """
+
+        self._args         = args     # callback arguments
+        self._callback     = callback # callback to execute when the deadline has passed
+        self._deadline     = deadline # time at which the callback will be executed
+        self._is_cancelled = False    # indicates that this timer has been cancelled
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def cancel (self):
+        """
+        Cancel the timer.
+
+        Note: Cancelled timers are not removed from the server timer heap until their deadline has passed.
+        """
+
+        self._is_cancelled = True
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def get_deadline (self):
+        """
+        Retrieve the deadline.
+
+        @return (float) The time at which the callback will be executed.
+        """
+
+        return self._deadline
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def is_cancelled (self):
+        """
+        Retrieve the cancellation status.
+
+        @return (bool) True, if the timer has been cancelled, otherwise False.
+        """
+
+        return self._is_cancelled
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class TimingWheel:
+
+    def __init__ (self, timeout, resolution):
+        """
+        Create a new TimingWheel instance.
+
+        A timing wheel tracks client idle timeouts with a fixed number of slots, each covering [resolution] seconds.
+        Moving a client to a new slot and expiring a slot are both constant time operations, so finding idle clients
+        costs O(expired) instead of O(clients).
+
+        @param timeout    (int/float) The client idle timeout.
+        @param resolution (int/float) The number of seconds covered by each slot.
+        """
+
+        self._resolution = float(resolution)                              # seconds covered by each slot
+        self._slot_count = int(math.ceil(timeout / self._resolution)) + 1 # number of slots
+        self._slots      = [set() for i in xrange(0, self._slot_count)]   # client sets indexed by tick
+        self._tick       = int(time.time() / self._resolution)            # most recently expired tick
+        self._timeout    = timeout                                        # client idle timeout
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def add (self, client, access_time):
+        """
+        Add a client, or move it to the slot that matches its new access time.
+
+        @param client      (Client) The client.
+        @param access_time (float)  The last access time for the client.
+        """
+
+        tick = max(int((access_time + self._timeout) / self._resolution) + 1, self._tick + 1)
+
+        if client._timeout_tick == tick:
+            return
+
+        if client._timeout_tick is not None:
+            self._slots[client._timeout_tick % self._slot_count].discard(client)
+
+        client._timeout_tick = tick
+
+        self._slots[tick % self._slot_count].add(client)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def expire (self, now):
+        """
+        Remove and return all clients that have timed out.
+
+        @param now (float) The current time.
+
+        @return (list) The list of clients that have timed out.
+        """
+
+        expired = []
+        slots   = self._slots
+        tick    = int(now / self._resolution)
+
+        # a single revolution visits every slot, so there is no need to go any further if we've fallen behind
+        for i in xrange(self._tick + 1, min(tick, self._tick + self._slot_count) + 1):
+            slot = slots[i % self._slot_count]
+
+            if not slot:
+                continue
+
+            for client in list(slot):
+                if client._timeout_tick > tick:
+                    # the client belongs to a future revolution, which only happens when we've fallen behind
+                    continue
+
+                slot.discard(client)
+
+                client._timeout_tick = None
+
+                expired.append(client)
+
+        self._tick = max(self._tick, tick)
+
+        return expired
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def remove (self, client):
+        """
+        Remove a client.
+
+        @param client (Client) The client.
+        """
+
+        if client._timeout_tick is None:
+            return
+
+        self._slots[client._timeout_tick % self._slot_count].discard(client)
+
+        client._timeout_tick = None
@@ -0,0 +1,103 @@
+# This file is part of Elements.
+# Copyright (c) 2010 Sean Kerr. All rights reserved.
+#
+# The full license is available in the LICENSE file that was distributed with this source code.
+#
+# Author: Sean Kerr <sean@code-box.org>
+
+import sys
+import thread
+import time
+import traceback
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class Watchdog:
+
+    def __init__ (self, threshold):
+        """
+        Create a new Watchdog instance.
+
+        A watchdog captures the stack of a callback that is still running after a threshold, so a report about a slow
+        callback can show where it was blocked rather than only how long it took. The event loop marks the start and
+        end of each callback, and a thread of its own checks the running callback periodically.
+
+        Note: The watchdog thread only wakes up twice per threshold and only reads what the event loop has marked, so it
+              never interrupts the event loop, and blocking system calls made by a callback are left alone.
+
+        @param threshold (float) The number of seconds after which a callback is slow.
+        """
+
+        self._stack     = None      # stack captured from the running callback
+        self._started   = 0         # time at which the running callback started, or 0 if no callback is running
+        self._thread_id = None      # identifier of the event loop thread
+        self._threshold = threshold # number of seconds after which a callback is slow
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def release (self):
+        """
+        Mark the end of the running callback.
+
+        @return (list) The stack captured while the callback was running, as a list of formatted lines, or None if the
+                       callback finished before the watchdog noticed it.
+        """
+
+        stack         = self._stack
+        self._stack   = None
+        self._started = 0
+
+        return stack
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def start (self):
+        """
+        Start watching the current thread.
+
+        Note: This must be called in each process, because threads do not survive a fork.
+        """
+
+        self._thread_id = thread.get_ident()
+
+        thread.start_new_thread(self.__watch, ())
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def watch (self, started):
+        """
+        Mark the start of a callback.
+
+        @param started (float) The time at which the callback started.
+        """
+
+        self._stack   = None
+        self._started = started
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __watch (self):
+        """
+        Capture the stack of each callback that runs beyond the threshold.
+        """
+
+        interval = max(self._threshold / 2.0, 0.001)
+
+        while True:
+            time.sleep(interval)
+
+            started = self._started
+
+            if not started or self._stack is not None or time.time() - started < self._threshold:
+                continue
+
+            frame = sys._current_frames().get(self._thread_id)
+
+            if frame is None:
+                continue
+
+            stack = traceback.format_stack(frame)
+
+            # the callback may have finished while its stack was being captured
+            if self._started == started:
+                self._stack = stack
@@ -5,12 +5,18 @@
 #
 # Author: Sean Kerr <sean@code-box.org>
 
+import json
 import os
+import time
 
 import settings
 
-from elements.http  import response_code
-from elements.model import database
+from elements.async.instrument import summarize
+from elements.core.exception   import ServerException
+from elements.http             import response_code
+from elements.http.static      import StaticFile
+from elements.http.static      import StaticFileCache
+from elements.model            import database
 
 # ----------------------------------------------------------------------------------------------------------------------
 
@@ -192,16 +198,26 @@ class SecureHttpAction (HttpAction):
 
 class StaticHttpAction (HttpAction):
 
-    def __init__ (self, fs_root, param="file", **kwargs):
+    def __init__ (self, fs_root, param="file", cache_size=8388608, cache_count=1024, cache_data_size=65536,
+                  cache_interval=1, cache_file_count=128, **kwargs):
         """
         Create a new StaticHttpAction instance.
 
-        @param fs_root (str) The absolute filesystem path from which all static files will be served.
-        @param param   (str) The parameter name to pull that contains the filename to serve.
+        Note: Each process caches the static files it has served. Files no larger than the cache data size are held in
+              memory, larger files are held open, and cached files are checked for changes at most once per interval.
+
+        @param fs_root          (str)       The absolute filesystem path from which all static files will be served.
+        @param param            (str)       The parameter name to pull that contains the filename to serve.
+        @param cache_size       (int)       The maximum total size of the file contents held in memory.
+        @param cache_count      (int)       The maximum number of cached files.
+        @param cache_data_size  (int)       The maximum size of a file for which the contents will be held in memory.
+        @param cache_interval   (int/float) The number of seconds between checks for changes to a cached file.
+        @param cache_file_count (int)       The maximum number of cached files that are held open.
         """
 
         HttpAction.__init__(self, **kwargs)
 
+        self._cache   = StaticFileCache(cache_size, cache_count, cache_data_size, cache_interval, cache_file_count)
         self._fs_root = os.path.realpath(fs_root)
         self._param   = param
 
@@ -214,11 +230,125 @@ class StaticHttpAction (HttpAction):
         @param client (HttpClient) The HttpClient instance.
         """
 
-        file = os.path.realpath("/".join((self._fs_root, client.params.get(self._param, "").strip(" /\\"))))
+        name        = client.params.get(self._param, "").strip(" /\\")
+        static_file = self._cache.get(name)
+
+        if not static_file:
+            file = os.path.realpath("/".join((self._fs_root, name)))
+
+            if not file.startswith(self._fs_root) or file == self._fs_root:
+                # wrong location
+                client.raise_response(response_code.HTTP_404)
+
+                return
+
+            try:
+                static_file = StaticFile(file, self._cache.get_data_max_size())
+
+            except:
+                # file doesn't exist/can't be opened for reading
+                client.raise_response(response_code.HTTP_404)
+
+                return
+
+            self._cache.set(name, static_file)
+
+        client.serve_static(static_file)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def get_cache_stats (self):
+        """
+        Retrieve the static file cache statistics for this process.
+
+        @return (dict) The number of cached files, hits and misses, and the total size of the file contents held in
+                       memory.
+        """
+
+        return self._cache.get_stats()
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class StatusHttpAction (HttpAction):
+
+    def __init__ (self, **kwargs):
+        """
+        Create a new StatusHttpAction instance.
+
+        Note: The status is read from the shared-memory counters of all processes, so the server must have been created
+              with stats enabled. Counters are published once per second, and each worker process starts counting from
+              zero when it's spawned. When the server is also instrumented, the histograms of each process are shown as
+              well.
+        """
+
+        HttpAction.__init__(self, **kwargs)
+
+        if not self._server._stats:
+            raise ServerException("StatusHttpAction requires a server with stats enabled")
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def get (self, client):
+        """
+        Handle a GET request.
+
+        Note: The status is rendered as json when the format parameter is json, otherwise it's rendered as html.
+
+        @param client (HttpClient) The HttpClient instance.
+        """
+
+        now   = time.time()
+        slots = self._server._stats.read()
+        total = { "slot": "total", "pid": "-", "started": min([slot["started"] for slot in slots] or [now]) }
+
+        for slot in slots:
+            slot["requests_per_second"] = slot["requests"] / max(now - slot["started"], 1)
+
+            for name in ("active", "bytes_read", "bytes_written", "connections", "errors", "handler_seconds",
+                         "poll_events", "poll_seconds", "polls", "requests", "requests_per_second", "slow_callbacks"):
+                total[name] = total.get(name, 0) + slot[name]
 
-        if not file.startswith(self._fs_root) or file == self._fs_root or not client.serve_static_file(file):
-            # wrong location or file doesn't exist/can't be opened for reading
-            client.raise_response(response_code.HTTP_404)
+            total["lag"] = max(total.get("lag", 0), slot["lag"])
+
+        if client.params.get("format") == "json":
+            client.content_type = "application/json"
+
+            client.compose_headers()
+            client.write(json.dumps({ "processes": slots, "total": total }))
+
+            return
+
+        client.compose_headers()
+        client.write("<html><head><title>Status</title></head><body><h1>Status</h1>")
+        client.write("<table><tr><th>Slot</th><th>Pid</th><th>Uptime</th><th>Connections</th><th>Active</th>"
+                     "<th>Requests</th><th>Requests/sec</th><th>Bytes read</th><th>Bytes written</th>"
+                     "<th>Errors</th><th>Lag ms</th><th>Slow callbacks</th></tr>")
+
+        for slot in slots + [total]:
+            client.write("<tr><td>%s</td><td>%s</td><td>%d</td><td>%d</td><td>%d</td><td>%d</td><td>%.2f</td>"
+                         "<td>%d</td><td>%d</td><td>%d</td><td>%.3f</td><td>%d</td></tr>" % \
+                         (slot["slot"], slot["pid"], now - slot["started"], slot.get("connections", 0),
+                          slot.get("active", 0), slot.get("requests", 0), slot.get("requests_per_second", 0),
+                          slot.get("bytes_read", 0), slot.get("bytes_written", 0), slot.get("errors", 0),
+                          slot.get("lag", 0) * 1000, slot.get("slow_callbacks", 0)))
+
+        client.write("</table>")
+
+        for slot in slots:
+            if not slot.get("histograms"):
+                continue
+
+            client.write("<h2>Instrumentation of process %d</h2>" % slot["pid"])
+            client.write("<table><tr><th>Name</th><th>Count</th><th>Mean ms</th><th>P50 ms</th><th>P99 ms</th>"
+                         "<th>Max ms</th></tr>")
+
+            for name, histogram in sorted(slot["histograms"].items()):
+                client.write("<tr><td>%s</td><td>%d</td><td>%.3f</td><td>%.3f</td><td>%.3f</td><td>%.3f</td></tr>" % \
+                             ((name,) + summarize(histogram)))
+
+            client.write("</table>")
+
+        client.write("</body></html>")
 
 # ----------------------------------------------------------------------------------------------------------------------
 
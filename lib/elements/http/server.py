@@ -13,6 +13,8 @@ except:
 
 import datetime
 import decimal
+import email.utils
+import errno
 import mimetypes
 import os
 import random
@@ -33,6 +35,7 @@ from elements.async.server   import Server
 from elements.http.action    import HttpAction
 from elements.http.action    import SecureHttpAction
 from elements.http           import response_code
+from elements.http.static    import StaticFile
 
 # ----------------------------------------------------------------------------------------------------------------------
 # ERROR CODES
@@ -44,7 +47,8 @@ ERROR_UPLOAD_MAX_SIZE = 1
 # MISC SETTINGS
 # ----------------------------------------------------------------------------------------------------------------------
 
-FILE_READ_SIZE = 131070
+CHUNK_WRITE_SIZE     = 65535
+FILE_RANGE_MAX_COUNT = 16
 
 PERSISTENCE_KEEP_ALIVE = 1
 PERSISTENCE_PROTOCOL   = 2
@@ -66,7 +70,8 @@ class HttpClient (Client):
 
         Client.__init__(self, client_socket, client_address, server, server_address)
 
-        self._chunked_write_buffer    = StringIO.StringIO() # chunk encoding write buffer
+        self._chunked_write_buffer    = []                  # chunk encoding write segments
+        self._chunked_write_length    = 0                   # length of the chunk encoding write segments
         self._is_allowing_persistence = False               # indicates that this client allows persistence
         self._is_headers_written      = False               # indicates that the headers have been written
         self._max_persistent_requests = None                # maximum persistent requests allowed
@@ -81,6 +86,10 @@ class HttpClient (Client):
         # even in the event that a timeout occurred before a request could physically be handled
         self.__files = []
 
+        # chunked encoding status must exist because it's accessed in handle_flush(), which may be executed before a
+        # request line has been handled
+        self.__is_chunked_encoded = False
+
         # read until we get the initial request line
         self.read_delimiter("\r\n", self.handle_request, settings.http_max_request_length)
 
@@ -151,7 +160,7 @@ class HttpClient (Client):
             # future write operations must use a chunked encoding
             self.write = self.__chunked_write
 
-        self.__is_chunked_encoded = True
+        self.__is_chunked_encoded = chunked_encoding
         self._is_headers_written  = True
 
     # ------------------------------------------------------------------------------------------------------------------
@@ -200,6 +209,19 @@ class HttpClient (Client):
 
     # ------------------------------------------------------------------------------------------------------------------
 
+    def handle_flush (self):
+        """
+        This callback will be executed right before the write buffer is written to the socket.
+        """
+
+        if self.__is_chunked_encoded:
+            # the chunked content goes out in the same send as the headers, and unless a producer is still active or
+            # has paused until the write buffer drains, or a deferred callback has yet to write, the handler has
+            # finished writing content
+            self.__chunked_flush(not self._is_write_paused and not self._producer and not self._hold_count)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
     def handle_headers (self, data):
         """
         This callback will be executed when headers are ready to be parsed.
@@ -416,6 +438,9 @@ class HttpClient (Client):
         self.session              = None
         self.write                = self._orig_write
 
+        if self._server._stats_slot:
+            self._server._stats_slot.requests += 1
+
         # parse method, uri and protocol
         try:
             data                  = data.rstrip()
@@ -575,22 +600,13 @@ class HttpClient (Client):
         This callback will be executed when the entire write buffer has been written.
         """
 
-        if self._static_file:
-            # serving a static file
-            data = self._static_file.read(FILE_READ_SIZE)
-
-            if len(data) > 0:
-                # more data to write
-                self.write(data)
-
-            else:
-                # finished reading file
-                self._static_file.close()
-
-                self._static_file = None
+        if self._hold_count:
+            # a deferred callback will write the rest of the response
+            return
 
-        if self._chunked_write_buffer.tell() > 0:
-            self.__chunked_flush()
+        if self.__is_chunked_encoded:
+            # the producer finished writing content while it was paused
+            self.__chunked_flush(True)
 
             return
 
@@ -613,30 +629,44 @@ class HttpClient (Client):
         """
 
         buffer         = self._read_buffer
-        data           = buffer.getvalue()
+        index          = self._read_index
         multipart_file = self._multipart_file
         multipart_name = self._multipart_name
         params         = self.params
-        pos            = data.find(delimiter)
+
+        if delimiter != self._read_delimiter:
+            # this is a new search, so the entire unconsumed buffer must be scanned
+            self._read_scan_index = index
+
+        # only scan the data that has arrived since the last scan
+        pos = buffer.find(delimiter, max(index, self._read_scan_index - len(delimiter) + 1))
+
+        if pos > -1:
+            pos -= index
+
+        else:
+            self._read_scan_index = len(buffer)
 
         if not multipart_file:
             # form field
             if pos > -1:
                 # boundary has been found
+                value = self.consume_read_buffer(pos - 2)
+
                 if multipart_name in params:
                     if type(params[multipart_name]) != list:
                         # param already existed, but wasn't a list so let's convert it
                         params[multipart_name] = [params[multipart_name]]
 
-                    params[multipart_name].append(data[:pos - 2])
+                    params[multipart_name].append(value)
 
                 else:
-                    params[multipart_name] = data[:pos - 2]
+                    params[multipart_name] = value
 
-                self.read_delimiter = self._orig_read_delimiter
+                self.read_delimiter  = self._orig_read_delimiter
+                self._read_delimiter = None
 
-                buffer.truncate(0)
-                buffer.write(data[pos + len(delimiter):])
+                self.consume_read_buffer(2 + len(delimiter))
 
                 # read until we consume 2 bytes (CRLF)
                 self.read_length(2, callback)
@@ -653,9 +683,10 @@ class HttpClient (Client):
             if pos > -1:
                 # boundary has been found, write the buffer minus 2 bytes (for \r\n) to the file
                 self._multipart_file = None
+                self._read_delimiter = None
                 self.read_delimiter  = self._orig_read_delimiter
 
-                chunk = data[:pos - 2]
+                chunk = self.consume_read_buffer(pos - 2)
 
                 if not self._is_multipart_maxed:
                     # flush end contents
@@ -671,8 +702,7 @@ class HttpClient (Client):
                         # upload is too big
                         file["error"] = ERROR_UPLOAD_MAX_SIZE
 
-                buffer.truncate(0)
-                buffer.write(data[pos + len(delimiter):])
+                self.consume_read_buffer(2 + len(delimiter))
 
                 file["size"] = os.stat(file["temp_name"]).st_size
 
@@ -684,9 +714,9 @@ class HttpClient (Client):
                 return
 
             # boundary has not been found
-            if len(data) >= settings.http_upload_buffer_size:
-                # flush the buffer to file
-                chunk = data[:-len(delimiter)]
+            if len(buffer) - index >= settings.http_upload_buffer_size:
+                # flush the buffer to file, keeping enough to catch a boundary that was split between two reads
+                chunk = self.consume_read_buffer(len(buffer) - index - len(delimiter))
 
                 self._multipart_file_size += len(chunk)
 
@@ -695,9 +725,6 @@ class HttpClient (Client):
                     multipart_file.write(chunk)
                     multipart_file.flush()
 
-                buffer.truncate(0)
-                buffer.write(data[len(data) - len(delimiter):])
-
                 # check file size limit
                 if settings.http_max_upload_size and settings.http_max_upload_size < self._multipart_file_size and \
                    not self._is_multipart_maxed:
@@ -784,48 +811,116 @@ class HttpClient (Client):
 
     # ------------------------------------------------------------------------------------------------------------------
 
-    def serve_static_file (self, path, filename=None):
+    def serve_static (self, static_file, filename=None):
         """
-        Serve a static file.
+        Serve a static file that has already been opened.
 
-        @param path     (str) The absolute filesystem path to the file.
-        @param filename (str) A substitute download filename.
+        Note: The response carries ETag and Last-Modified validators, a fresh client copy is revalidated with a 304
+              response, and Range requests are answered with a 206 response containing one or more byte ranges.
 
-        @return (bool) True, if the file will be served, otherwise False.
+        @param static_file (StaticFile) The static file.
+        @param filename    (str)        A substitute download filename.
         """
 
-        try:
-            file = open(path, "rb")
+        etag          = static_file.etag
+        last_modified = static_file.last_modified
+        out_headers   = self.out_headers
+        size          = static_file.size
 
-            self._static_file = file
+        self._static_file = static_file
 
-            if not filename:
-                filename = os.path.basename(path)
+        out_headers["Accept-Ranges"] = "bytes"
+        out_headers["ETag"]          = etag
+        out_headers["Last-Modified"] = last_modified
 
-            self.out_headers["Content-Disposition"] = "attachment; filename=%s" % filename
+        if self.__is_not_modified(etag, static_file.mtime):
+            # the client copy is still fresh
+            self.response_code = response_code.HTTP_304
 
-            # determine mimetype
-            mimetype = mimetypes.guess_type(path)
+            self.compose_headers()
 
-            if mimetype[0]:
-                self.content_type = mimetype[0]
+            return
 
-            elif mimetype[1]:
-                self.content_type = "+".join(("text/", mimetype[1]))
+        out_headers["Content-Disposition"] = "attachment; filename=%s" % (filename or static_file.filename)
 
-            else:
-                self.content_type = "text/plain"
+        self.content_type = static_file.content_type
+
+        # a range is ignored when the client copy it belongs to is out of date
+        ranges = None
+
+        if "HTTP_RANGE" in self.in_headers and self.in_headers.get("HTTP_IF_RANGE", etag) in (etag, last_modified):
+            ranges = self.__parse_ranges(self.in_headers["HTTP_RANGE"], size)
+
+        # compose headers and send the file without reading it into memory
+        if ranges is None:
+            out_headers["Content-Length"] = str(size)
+
+            self.compose_headers()
+            self.__write_static_file(static_file, 0, size)
+
+        elif not ranges:
+            # none of the ranges can be satisfied
+            out_headers["Content-Length"] = "0"
+            out_headers["Content-Range"]  = "bytes */%d" % size
+
+            self.response_code = response_code.HTTP_416
+
+            self.compose_headers()
+
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+
+            out_headers["Content-Length"] = str(end - start + 1)
+            out_headers["Content-Range"]  = "bytes %d-%d/%d" % (start, end, size)
+
+            self.response_code = response_code.HTTP_206
+
+            self.compose_headers()
+            self.__write_static_file(static_file, start, end - start + 1)
+
+        else:
+            boundary = "%016x" % random.getrandbits(64)
+            closing  = "\r\n--%s--\r\n" % boundary
+            parts    = ["\r\n--%s\r\nContent-Type: %s\r\nContent-Range: bytes %d-%d/%d\r\n\r\n" % \
+                        (boundary, self.content_type, start, end, size) for start, end in ranges]
+
+            out_headers["Content-Length"] = str(sum([len(part) for part in parts]) + len(closing) +
+                                                sum([end - start + 1 for start, end in ranges]))
+
+            self.content_type  = "multipart/byteranges; boundary=%s" % boundary
+            self.response_code = response_code.HTTP_206
 
-            # compose headers and write the first portion of the file
             self.compose_headers()
-            self.write(file.read(FILE_READ_SIZE))
 
-            return True
+            for part, (start, end) in zip(parts, ranges):
+                self.write(part)
+                self.__write_static_file(static_file, start, end - start + 1)
+
+            self.write(closing)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def serve_static_file (self, path, filename=None):
+        """
+        Serve a static file.
+
+        @param path     (str) The absolute filesystem path to the file.
+        @param filename (str) A substitute download filename.
+
+        @return (bool) True, if the file will be served, otherwise False.
+        """
+
+        try:
+            static_file = StaticFile(path)
 
         except:
             # file doesn't exist or permission denied
             return False
 
+        self.serve_static(static_file, filename)
+
+        return True
+
     # ------------------------------------------------------------------------------------------------------------------
 
     def start_session (self):
@@ -883,19 +978,33 @@ class HttpClient (Client):
 
     # ------------------------------------------------------------------------------------------------------------------
 
-    def __chunked_flush (self):
+    def __chunked_flush (self, is_finished):
         """
         Notify the event manager that there is write data available.
+
+        @param is_finished (bool) Indicates that the content has been entirely written and the response should end.
         """
 
         # flush using chunked transfer encoding
-        buffer = self._chunked_write_buffer
-        data   = buffer.getvalue()
+        # note: the chunk framing is written as separate segments so that the content never has to be concatenated
+        segments = self._chunked_write_buffer
+
+        if segments:
+            Client.write(self, "%x\r\n" % self._chunked_write_length)
+
+            for data in segments:
+                Client.write(self, data)
+
+            Client.write(self, "\r\n")
+
+            del segments[:]
 
-        buffer.truncate(0)
+            self._chunked_write_length = 0
 
-        Client.write(self, "".join((hex(len(data))[2:], "\r\n", data, "\r\n")))
-        Client.write(self, "0\r\n")
+        if is_finished:
+            Client.write(self, "0\r\n\r\n")
+
+            self.__is_chunked_encoded = False
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -904,23 +1013,138 @@ class HttpClient (Client):
         Append data onto the write buffer.
         """
 
-        self._chunked_write_buffer.write(data)
+        if data:
+            self._chunked_write_buffer.append(data)
+
+            self._chunked_write_length += len(data)
+
+            if self._chunked_write_length >= CHUNK_WRITE_SIZE:
+                # large content is sent in multiple chunks so that it counts towards the write buffer watermarks
+                self.__chunked_flush(False)
+
+        # the content is flushed before the next write, which may happen after the headers have been written, such as
+        # from a deferred callback
+        self._events |= self._server.EVENT_WRITE
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __is_not_modified (self, etag, mtime):
+        """
+        Determine whether or not the client copy of a static file is still fresh.
+
+        @param etag  (str) The static file entity tag.
+        @param mtime (int) The static file modification time.
+
+        @return (bool) True, if the client copy is still fresh, otherwise False.
+        """
+
+        if_none_match = self.in_headers.get("HTTP_IF_NONE_MATCH")
+
+        if if_none_match is not None:
+            # entity tags take precedence over the modification time
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+
+            return "*" in tags or etag in tags or "W/" + etag in tags
+
+        if_modified_since = self.in_headers.get("HTTP_IF_MODIFIED_SINCE")
+
+        if if_modified_since:
+            date = email.utils.parsedate_tz(if_modified_since)
+
+            return date is not None and email.utils.mktime_tz(date) >= mtime
+
+        return False
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __parse_ranges (self, header, size):
+        """
+        Parse a Range header.
+
+        @param header (str) The Range header.
+        @param size   (int) The static file size.
+
+        @return (list) A list of (start, end) tuples for the satisfiable ranges, or None if the header is invalid or
+                       asks for too many ranges, in which case the entire file will be served.
+        """
+
+        if not header.startswith("bytes="):
+            return None
+
+        ranges = []
+        specs  = [spec.strip() for spec in header[6:].split(",") if spec.strip()]
+
+        if not specs or len(specs) > FILE_RANGE_MAX_COUNT:
+            return None
+
+        for spec in specs:
+            start, separator, end = spec.partition("-")
+            start                 = start.strip()
+            end                   = end.strip()
+
+            if not separator or not (start or end) or not (start or "0").isdigit() or not (end or "0").isdigit():
+                return None
+
+            if not start:
+                # the range is a suffix length
+                if int(end) > 0 and size > 0:
+                    ranges.append((max(size - int(end), 0), size - 1))
+
+                continue
+
+            if end and int(end) < int(start):
+                return None
+
+            if int(start) < size:
+                ranges.append((int(start), min(int(end or size - 1), size - 1)))
+
+        return ranges
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __write_static_file (self, static_file, start, length):
+        """
+        Append a portion of a static file onto the write buffer.
+
+        @param static_file (StaticFile) The static file.
+        @param start       (int)        The offset at which the portion starts.
+        @param length      (int)        The portion length.
+        """
+
+        if static_file.data is None:
+            # the write buffer gets a file object of its own, because the cache closes the file of an evicted entry
+            # while the region may still be waiting to be sent
+            self.write_file(os.fdopen(os.dup(static_file.file.fileno()), "rb"), start, length)
+
+        elif length == static_file.size:
+            self.write(static_file.data)
+
+        else:
+            self.write(static_file.data[start:start + length])
 
 # ----------------------------------------------------------------------------------------------------------------------
 
 class HttpRequest (Client):
 
-    def __init__ (self, server, host, port=80):
+    def __init__ (self, server, host, port=80, connect_timeout=None):
         """
         Create a new HttpRequest instance.
 
-        @param server (Server) The Server instance.
-        @param host   (str)    The hostname.
-        @param port   (int)    The port.
+        The hostname is resolved and the connection is established without blocking the event loop, and the request
+        registers itself as a client once the connection is in progress. The request can be opened right away, in
+        which case it's written as soon as the connection has been established.
+
+        @param server          (Server) The Server instance.
+        @param host            (str)    The hostname.
+        @param port            (int)    The port.
+        @param connect_timeout (float)  The number of seconds to wait for the hostname to be resolved and the connection
+                                        to be established, or None to wait indefinitely.
         """
 
         self._basic_content_types = ["text/plain", "text/html"]
+        self._connect_timer       = None
         self._host                = host
+        self._is_connecting       = True
         self._port                = port
         self._server              = server
         self._socket              = None
@@ -931,17 +1155,19 @@ class HttpRequest (Client):
         try:
             self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
-            self._socket.connect((self._host, self._port))
-            self._socket.setblocking(0)
-
             # initialize parent class
-            Client.__init__(self, self._socket, (socket.gethostbyname(host), port), server, ('0.0.0.0', 80))
+            Client.__init__(self, self._socket, (host, port), server, ('0.0.0.0', 80))
 
         except Exception, e:
             raise ClientException("Cannot connect to %s: %s" % (self._host, str(e)))
 
-        # register as a client
-        server.register_client(self)
+        # nothing is watched until the connection is in progress
+        self._events = 0
+
+        if connect_timeout:
+            self._connect_timer = server.call_later(connect_timeout, self.__handle_connect_timeout)
+
+        server.resolve(host, self.__handle_resolved)
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -988,6 +1214,27 @@ class HttpRequest (Client):
 
     # ------------------------------------------------------------------------------------------------------------------
 
+    def handle_connect (self):
+        """
+        This callback will be executed when the connection has been established.
+        """
+
+        pass
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def handle_connect_error (self, error):
+        """
+        This callback will be executed when the hostname cannot be resolved, the connection cannot be established, or
+        the connect timeout has passed. The request has been shutdown by the time this is executed.
+
+        @param error (str) The error message.
+        """
+
+        raise ClientException("Cannot connect to %s: %s" % (self._host, error))
+
+    # ------------------------------------------------------------------------------------------------------------------
+
     def handle_content_chunk (self, data):
         """
         This callback will be executed for each chunk in a chunked transfer.
@@ -1085,6 +1332,19 @@ class HttpRequest (Client):
 
     # ------------------------------------------------------------------------------------------------------------------
 
+    def handle_error (self):
+        """
+        This callback will be executed when a read/write error has occurred.
+        """
+
+        if self._is_connecting:
+            # the connection has been refused, and the event loop unregisters this request afterwards
+            self.clear_events()
+
+            self.__fail(os.strerror(self._client_socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)))
+
+    # ------------------------------------------------------------------------------------------------------------------
+
     def handle_finished (self):
         """
         This callback will be executed at the end of a successful request.
@@ -1203,6 +1463,11 @@ class HttpRequest (Client):
 
         Client.handle_shutdown(self)
 
+        if self._connect_timer:
+            self._connect_timer.cancel()
+
+            self._connect_timer = None
+
         if self.files:
             # close any open files
             for file in self.files:
@@ -1214,6 +1479,45 @@ class HttpRequest (Client):
 
     # ------------------------------------------------------------------------------------------------------------------
 
+    def handle_write (self):
+        """
+        This callback will be executed when write data is available, or when the connection attempt has finished.
+        """
+
+        if self._is_connecting:
+            error = self._client_socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+
+            if error:
+                # the event loop unregisters this request once it has no events left
+                self.clear_events()
+
+                self.__fail(os.strerror(error))
+
+                return
+
+            self._is_connecting = False
+
+            if self._connect_timer:
+                self._connect_timer.cancel()
+
+                self._connect_timer = None
+
+            if self._read_callback:
+                # the request was opened while connecting, so the response can be read now
+                self._events |= self._server.EVENT_READ
+
+            self.handle_connect()
+
+            if not self._write_buffer:
+                # the request hasn't been opened yet, so it lingers to stay registered until open() writes it
+                self._events = (self._events & ~self._server.EVENT_WRITE) | self._server._event_manager.EVENT_LINGER
+
+                return
+
+        Client.handle_write(self)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
     def handle_write_finished (self):
         """
         This callback will be executed when the entire write buffer has been written.
@@ -1289,8 +1593,16 @@ class HttpRequest (Client):
         # read until we reach the end of the initial response line
         self.read_delimiter("\r\n", self.handle_response_code)
 
-        # update our events
-        self._server.modify_client(self)
+        if self._is_connecting:
+            # a refused connection can be reported as readable, so only handle_write() checks how the connection ended
+            self._events &= ~self._server.EVENT_READ
+
+        # the request no longer needs to linger once it has been written
+        self._events &= ~self._server._event_manager.EVENT_LINGER
+
+        if self._server._clients.get(self._fileno) is self:
+            # update our events, unless the hostname is still being resolved
+            self._server.modify_client(self)
 
     # ------------------------------------------------------------------------------------------------------------------
 
@@ -1394,6 +1706,79 @@ class HttpRequest (Client):
 
         self.parameters.update(parameters)
 
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __fail (self, error):
+        """
+        Stop connecting and execute the connect error callback.
+
+        @param error (str) The error message.
+        """
+
+        self._is_connecting = False
+
+        if self._connect_timer:
+            self._connect_timer.cancel()
+
+            self._connect_timer = None
+
+        self.handle_connect_error(error)
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __handle_connect_timeout (self):
+        """
+        Shutdown the request when the connection hasn't been established in time.
+        """
+
+        self._connect_timer = None
+
+        if not self._is_connecting:
+            return
+
+        if self._server._clients.get(self._fileno) is self:
+            self._server.unregister_client(self)
+
+        else:
+            # the hostname is still being resolved, so the request hasn't been registered
+            self.handle_shutdown()
+
+        self.__fail("Connection timed out")
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __handle_resolved (self, address):
+        """
+        Start connecting once the hostname has been resolved.
+
+        @param address (str) The ip address. If the lookup failed, this is the exception instance instead.
+        """
+
+        if not self._is_connecting:
+            # the connect timeout has passed
+            return
+
+        if isinstance(address, Exception):
+            self.handle_shutdown()
+            self.__fail(str(address))
+
+            return
+
+        self._client_address = (address, self._port)
+
+        error = self._client_socket.connect_ex(self._client_address)
+
+        if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            self.handle_shutdown()
+            self.__fail(os.strerror(error))
+
+            return
+
+        # the socket becomes writable once the connection attempt has finished
+        self._events |= self._server.EVENT_WRITE
+
+        self._server.register_client(self)
+
 # ----------------------------------------------------------------------------------------------------------------------
 
 class HttpServer (Server):
@@ -1492,6 +1877,36 @@ class HttpServer (Server):
 
     # ------------------------------------------------------------------------------------------------------------------
 
+    def handle_slow_callback (self, client, callback, elapsed, stack):
+        """
+        This callback will be executed when a client or timer callback has run beyond the slow callback threshold.
+
+        Note: Requests are dispatched from within handle_read(), so the request the client was handling is reported
+              along with the callback.
+
+        @param client   (Client) The client to which the callback belongs, or None if the callback is a timer.
+        @param callback (str)    The callback name.
+        @param elapsed  (float)  The number of seconds the callback ran.
+        @param stack    (list)   The stack at which the callback was running once it passed the threshold, as a list of
+                                 formatted lines, or None if the callback finished before it could be captured.
+        """
+
+        in_headers = getattr(client, "in_headers", None)
+
+        if not in_headers or "REQUEST_METHOD" not in in_headers:
+            Server.handle_slow_callback(self, client, callback, elapsed, stack)
+
+            return
+
+        print "Slow callback in process %d: %s.%s() ran for %.3f ms handling %s %s" % \
+              (os.getpid(), client.__class__.__name__, callback, elapsed * 1000, in_headers["REQUEST_METHOD"],
+               in_headers["REQUEST_URL"])
+
+        if stack:
+            print "".join(stack).rstrip()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
     def register_response_action (self, response_code, action, args=dict()):
         """
         Register a custom response action.
@@ -0,0 +1,273 @@
+# This file is part of Elements.
+# Copyright (c) 2010 Sean Kerr. All rights reserved.
+#
+# The full license is available in the LICENSE file that was distributed with this source code.
+#
+# Author: Sean Kerr <sean@code-box.org>
+
+import email.utils
+import mimetypes
+import os
+import time
+
+from collections import OrderedDict
+
+try:
+    import resource
+
+except ImportError:
+    resource = None
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class StaticFile:
+
+    def __init__ (self, path, data_max_size=0):
+        """
+        Create a new StaticFile instance.
+
+        A static file holds everything that's needed to serve a file without touching the filesystem again: its
+        validators, its content type, and either its contents or an open file object from which it can be sent.
+
+        @param path          (str) The absolute filesystem path to the file.
+        @param data_max_size (int) The maximum file size for which the contents will be held in memory instead of an
+                                   open file object.
+        """
+
+        file  = open(path, "rb")
+        stat  = os.fstat(file.fileno())
+        mtime = int(stat.st_mtime)
+        etag  = "\"%x-%x-%x\"" % (stat.st_ino, stat.st_size, mtime)
+
+        self.content_type  = None                                       # content type
+        self.data          = None                                       # file contents
+        self.etag          = etag                                       # entity tag
+        self.file          = None                                       # open file object
+        self.filename      = os.path.basename(path)                     # download filename
+        self.last_modified = email.utils.formatdate(mtime, usegmt=True) # last modified date
+        self.mtime         = mtime                                      # modification time
+        self.path          = path                                       # absolute filesystem path
+        self.size          = stat.st_size                               # file size
+
+        self._checked_time = time.time()                                # last time the file was revalidated
+        self._identity     = (stat.st_ino, stat.st_size, stat.st_mtime) # stat details used for revalidation
+
+        # determine mimetype
+        mimetype = mimetypes.guess_type(path)
+
+        if mimetype[0]:
+            self.content_type = mimetype[0]
+
+        elif mimetype[1]:
+            self.content_type = "+".join(("text/", mimetype[1]))
+
+        else:
+            self.content_type = "text/plain"
+
+        if self.size <= data_max_size:
+            # small files are held in memory
+            try:
+                self.data = file.read()
+
+            finally:
+                file.close()
+
+        else:
+            self.file = file
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def close (self):
+        """
+        Close the open file object, if there is one.
+        """
+
+        if self.file:
+            self.file.close()
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def is_modified (self):
+        """
+        Determine whether or not the file has been modified, replaced or removed since it was opened.
+
+        @return (bool) True, if the file has been modified, otherwise False.
+        """
+
+        try:
+            stat = os.stat(self.path)
+
+        except OSError:
+            return True
+
+        return (stat.st_ino, stat.st_size, stat.st_mtime) != self._identity
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class StaticFileCache:
+
+    def __init__ (self, max_size=8388608, max_count=1024, data_max_size=65536, interval=1, file_max_count=128):
+        """
+        Create a new StaticFileCache instance.
+
+        A static file cache is a least recently used cache of static files, bounded by the total size of the contents
+        held in memory, by the number of entries, and by the number of large files, which are held as open file
+        objects. Entries are checked against the filesystem at most once per interval. Each process owns its own cache.
+
+        Note: The open file count is also kept below an eighth of the process file descriptor limit, and the file object
+              of an entry is closed as soon as the entry is evicted or found to be modified.
+
+        @param max_size       (int)       The maximum total size of the contents held in memory.
+        @param max_count      (int)       The maximum number of entries.
+        @param data_max_size  (int)       The maximum file size for which the contents will be held in memory.
+        @param interval       (int/float) The number of seconds between revalidations of an entry.
+        @param file_max_count (int)       The maximum number of entries held as open file objects.
+        """
+
+        if resource:
+            limit = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+            if limit != resource.RLIM_INFINITY:
+                file_max_count = min(file_max_count, max(1, limit / 8))
+
+        self._data_max_size  = min(data_max_size, max_size) # maximum file size for which the contents are held in memory
+        self._entries        = OrderedDict()                # static files indexed by key, least recently used first
+        self._file_count     = 0                            # number of entries held as open file objects
+        self._file_max_count = file_max_count               # maximum number of entries held as open file objects
+        self._hits           = 0                            # number of lookups that found a fresh entry
+        self._interval       = interval                     # seconds between revalidations of an entry
+        self._max_count      = max_count                    # maximum number of entries
+        self._max_size       = max_size                     # maximum total size of the contents held in memory
+        self._misses         = 0                            # number of lookups that didn't find a fresh entry
+        self._size           = 0                            # total size of the contents held in memory
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def clear (self):
+        """
+        Remove all entries.
+        """
+
+        for static_file in self._entries.values():
+            static_file.close()
+
+        self._entries.clear()
+
+        self._file_count = 0
+        self._size       = 0
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def get (self, key):
+        """
+        Retrieve a static file.
+
+        @param key (str) The key.
+
+        @return (StaticFile) The static file, if it's cached and hasn't been modified, otherwise None.
+        """
+
+        static_file = self._entries.pop(key, None)
+
+        if static_file:
+            now = time.time()
+
+            if now - static_file._checked_time >= self._interval:
+                if static_file.is_modified():
+                    # the file has changed since it was cached
+                    self.__discard(static_file)
+
+                    static_file = None
+
+                else:
+                    static_file._checked_time = now
+
+        if not static_file:
+            self._misses += 1
+
+            return None
+
+        # move the entry to the most recently used end
+        self._entries[key]  = static_file
+        self._hits         += 1
+
+        return static_file
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def get_data_max_size (self):
+        """
+        Retrieve the maximum file size for which the contents will be held in memory.
+
+        @return (int) The maximum file size.
+        """
+
+        return self._data_max_size
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def get_stats (self):
+        """
+        Retrieve the cache statistics.
+
+        @return (dict) The number of entries, open files, hits and misses, and the total size of the contents held in
+                       memory.
+        """
+
+        return { "count":  len(self._entries),
+                 "files":  self._file_count,
+                 "hits":   self._hits,
+                 "misses": self._misses,
+                 "size":   self._size }
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def set (self, key, static_file):
+        """
+        Cache a static file.
+
+        @param key         (str)        The key.
+        @param static_file (StaticFile) The static file.
+        """
+
+        entries = self._entries
+
+        if key in entries:
+            self.__discard(entries.pop(key))
+
+        entries[key] = static_file
+
+        if static_file.file:
+            self._file_count += 1
+
+        else:
+            self._size += len(static_file.data)
+
+        while entries and (self._size > self._max_size or len(entries) > self._max_count):
+            # evict the least recently used entry
+            self.__discard(entries.popitem(last=False)[1])
+
+        if self._file_count > self._file_max_count:
+            # evict the least recently used entry held as an open file object
+            for name, entry in entries.iteritems():
+                if entry.file:
+                    self.__discard(entries.pop(name))
+
+                    break
+
+    # ------------------------------------------------------------------------------------------------------------------
+
+    def __discard (self, static_file):
+        """
+        Release a static file that's no longer cached.
+
+        @param static_file (StaticFile) The static file.
+        """
+
+        if static_file.file:
+            self._file_count -= 1
+
+            static_file.close()
+
+        else:
+            self._size -= len(static_file.data)